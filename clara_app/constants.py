@@ -86,6 +86,28 @@ Return ONLY the label name. Do not explain.
 RETRO_UI = True
 FREE_DAILY_MESSAGE_LIMIT = 50
 PLUS_DAILY_MESSAGE_LIMIT = None
+CHAT_DOC_CACHE_TTL_SECONDS = 30 # How long a chats/{id} snapshot can serve profile/plan/summary reads
+HISTORY_PAGE_SIZE = 60 # Messages per history page (first load and each "load older")
+ARCHIVE_AFTER_DAYS = 30 # Compaction rolls messages older than this into archive docs
+ARCHIVE_CHUNK_SIZE = 200 # Messages per archive doc (also capped by ARCHIVE_MAX_BYTES)
+ARCHIVE_MAX_BYTES = 700_000 # Keep archive docs well under Firestore's 1 MiB document limit
+METRIC_SHARD_COUNT = 10 # Shard docs per Firestore metrics counter (each doc sustains ~1 write/sec)
+METRICS_FLUSH_INTERVAL_SECONDS = 5 # Tally topic metrics in process and flush this often; 0 writes every increment
+FIRESTORE_PROBE_INTERVAL_SECONDS = 60 # Health-check the shared Firestore client this often (one doc read); 0 disables
+FIRESTORE_CALL_TIMEOUT_SECONDS = 10 # Per-call deadline for Firestore reads/writes, retries included
+CHAT_VIEW_LOAD_TIMEOUT_SECONDS = 3 # Deadline for the async chat-view reads before falling back to sync storage
+EMBEDDING_CACHE_MEMORY_ENTRIES = 2048 # In-process LRU of recent embeddings (~3 KB each)
+EMBEDDING_CACHE_DISK_ENTRIES = 100_000 # On-disk embedding cache bound; least recently used rows are evicted
+MEMORY_INGEST_WORKERS = 2 # Background threads embedding/upserting chat memories; 0 stores them inline
+MEMORY_INGEST_QUEUE_SIZE = 1000 # Pending memories before producers store inline (backpressure)
+MEMORY_INGEST_BATCH_SIZE = 32 # Memories per embedding request / upsert in the background ingest
+MEMORY_DEDUPE_RECENT = 32 # Recent memories per user checked for near-duplicates before upsert; 0 disables
+MEMORY_DEDUPE_SIMILARITY = 0.97 # Cosine similarity at which a new memory counts as a repeat of a recent one
+MEMORY_CONSOLIDATE_AFTER_DAYS = 90 # scripts/consolidate_memories.py folds memories older than this into summaries
+MEMORY_CONSOLIDATE_SIMILARITY = 0.8 # Cosine similarity for memories (same tone) to share a consolidation cluster
+MEMORY_RERANK_OVERFETCH = 4 # Memory searches fetch this many times the results they return, then re-rank
+MEMORY_RERANK_BLEND = {"similarity": 0.7, "recency": 0.2, "weight": 0.1} # Re-rank score = sum of coefficient * signal (each 0-1)
+MEMORY_RERANK_HALF_LIFE_DAYS = 30 # Recency signal halves every this many days
 
 # Env Vars & Secrets
 API_KEY = st.secrets.get("GEMINI_API_KEY") or os.environ.get("GEMINI_API_KEY")
@@ -93,6 +115,12 @@ USER_ID_SALT = (st.secrets.get("USER_ID_SALT") or os.environ.get("USER_ID_SALT")
 FORCE_PLAN = (st.secrets.get("CLARA_FORCE_PLAN") or os.environ.get("CLARA_FORCE_PLAN") or "").strip().lower()
 if FORCE_PLAN not in ("", "free", "plus"):
     FORCE_PLAN = ""
+STORAGE_BACKEND = (st.secrets.get("CLARA_STORAGE_BACKEND") or os.environ.get("CLARA_STORAGE_BACKEND") or "firestore").strip().lower()
+if STORAGE_BACKEND not in ("firestore", "sqlite"):
+    STORAGE_BACKEND = "firestore"
+SQLITE_DB_PATH = st.secrets.get("CLARA_SQLITE_PATH") or os.environ.get("CLARA_SQLITE_PATH") or "clara.db"
+# Turn off once scripts/migrate_legacy_chats.py has run, so reads stop checking legacy migration state
+LEGACY_MIGRATION_ON_READ = str(st.secrets.get("CLARA_LEGACY_MIGRATION_ON_READ") or os.environ.get("CLARA_LEGACY_MIGRATION_ON_READ") or "1").strip().lower() not in ("0", "false", "off", "no")
 FIREBASE_SERVICE_ACCOUNT = st.secrets.get("FIREBASE_SERVICE_ACCOUNT")
 FIREBASE_CREDENTIALS_PATH = st.secrets.get("FIREBASE_CREDENTIALS_PATH", "clara-companion-fe6a8-firebase-adminsdk-fbsvc-fca8258bfb.json")
 FIREBASE_WEB_API_KEY = st.secrets.get("FIREBASE_WEB_API_KEY") or os.environ.get("FIREBASE_WEB_API_KEY")
@@ -101,4 +129,15 @@ MASTER_EMAILS = ["maxttocs@gmail.com"]
 MASTER_DOMAINS = ["astrlabs.com"] # Add any other domains you want to have automatic "Master" access
 DEVELOPER_KEY = st.secrets.get("DEVELOPER_KEY") or "CLARA_DEV_2026" # Secret key for your personal bypass
 PINECONE_API_KEY = st.secrets.get("PINECONE_API_KEY") or os.environ.get("PINECONE_API_KEY")
+# Data-plane host of the memory index, as printed by scripts/bootstrap_pinecone_index.py (skips the lookup at startup)
+PINECONE_INDEX_HOST = st.secrets.get("PINECONE_INDEX_HOST") or os.environ.get("PINECONE_INDEX_HOST")
+# On-disk embedding cache; set to an empty string to keep only the in-process tier
+EMBEDDING_CACHE_PATH = st.secrets.get("CLARA_EMBEDDING_CACHE_PATH", os.environ.get("CLARA_EMBEDDING_CACHE_PATH", "embeddings.db"))
+# Turn off once scripts/migrate_memory_namespaces.py has run, so searches stop also querying the shared namespace
+MEMORY_LEGACY_NAMESPACE_FALLBACK = str(st.secrets.get("CLARA_MEMORY_LEGACY_FALLBACK") or os.environ.get("CLARA_MEMORY_LEGACY_FALLBACK") or "1").strip().lower() not in ("0", "false", "off", "no")
+# Where memory vectors live: Pinecone (needs PINECONE_API_KEY) or an in-process index under VECTOR_INDEX_PATH
+VECTOR_BACKEND = (st.secrets.get("CLARA_VECTOR_BACKEND") or os.environ.get("CLARA_VECTOR_BACKEND") or "pinecone").strip().lower()
+if VECTOR_BACKEND not in ("pinecone", "local"):
+    VECTOR_BACKEND = "pinecone"
+VECTOR_INDEX_PATH = st.secrets.get("CLARA_VECTOR_INDEX_PATH") or os.environ.get("CLARA_VECTOR_INDEX_PATH") or "vector_index"
 
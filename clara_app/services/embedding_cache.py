@@ -0,0 +1,182 @@
+import hashlib
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+try:
+    # Newer SQLite build shipped via requirements.txt on Linux hosts.
+    import pysqlite3 as sqlite3
+except ImportError:
+    import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    task_type TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used);
+"""
+
+# Check the disk bound every this many inserts rather than on each one.
+EVICTION_CHECK_EVERY = 100
+
+def cache_key(model: str, task_type: str, text: str, title: str | None = None) -> str:
+    digest = hashlib.sha256(f"{title or ''}\0{text}".encode("utf-8")).hexdigest()
+    return f"{model}|{task_type}|{digest}"
+
+class EmbeddingCache:
+    """
+    Two-tier cache of embedding vectors keyed by (model, task_type, sha256(text)).
+    Tier 1 is an in-process LRU; tier 2 is a SQLite file that survives restarts
+    and is shared by every process on the host. Vectors are stored as float32.
+    Both tiers are size bounded (least recently used entries go first).
+    """
+
+    def __init__(self, memory_entries: int = 2048, path: str | None = None, disk_entries: int = 100_000):
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._inserts = 0
+        self._conn = None
+        self._disk_lock = threading.Lock()
+        if path:
+            try:
+                self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn.executescript(SCHEMA)
+            except Exception as e:
+                print(f"Embedding cache disk tier disabled: {e}")
+                self._conn = None
+
+    def get_or_compute(self, model: str, task_type: str, text: str, compute, title: str | None = None):
+        """Return the cached vector, or call compute() and cache its result (None isn't cached)."""
+        key = cache_key(model, task_type, text, title)
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.memory_hits += 1
+                return list(vector)
+
+        vector = self._disk_get(key)
+        if vector is not None:
+            with self._lock:
+                self.disk_hits += 1
+            self._remember(key, vector)
+            return list(vector)
+
+        with self._lock:
+            self.misses += 1
+        vector = compute()
+        if vector is None:
+            return None
+        vector = array("f", vector)
+        self._remember(key, vector)
+        self._disk_put(key, model, task_type, vector)
+        return list(vector)
+
+    def get_many_or_compute(self, model: str, task_type: str, texts: list, compute_many, title: str | None = None):
+        """
+        Vectors for several texts; the ones not cached are computed together with a
+        single compute_many(missing_texts) call. Entries are None where that failed.
+        """
+        results = [None] * len(texts)
+        missing = []
+        for i, text in enumerate(texts):
+            key = cache_key(model, task_type, text, title)
+            with self._lock:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    self.memory_hits += 1
+            if vector is None:
+                vector = self._disk_get(key)
+                if vector is not None:
+                    with self._lock:
+                        self.disk_hits += 1
+                    self._remember(key, vector)
+            if vector is not None:
+                results[i] = list(vector)
+            else:
+                missing.append(i)
+
+        if missing:
+            with self._lock:
+                self.misses += len(missing)
+            computed = compute_many([texts[i] for i in missing]) or []
+            for i, vector in zip(missing, computed):
+                if vector is None:
+                    continue
+                vector = array("f", vector)
+                key = cache_key(model, task_type, texts[i], title)
+                self._remember(key, vector)
+                self._disk_put(key, model, task_type, vector)
+                results[i] = list(vector)
+        return results
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.memory_entries:
+                self._lru.popitem(last=False)
+
+    def _disk_get(self, key):
+        if self._conn is None:
+            return None
+        try:
+            with self._disk_lock:
+                row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                self._conn.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+            vector = array("f")
+            vector.frombytes(row[0])
+            return vector
+        except Exception as e:
+            print(f"Embedding cache read error: {e}")
+            return None
+
+    def _disk_put(self, key, model, task_type, vector):
+        if self._conn is None:
+            return
+        try:
+            with self._disk_lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, model, task_type, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (key, model, task_type, vector.tobytes(), time.time()),
+                )
+                self._inserts += 1
+                if self._inserts % EVICTION_CHECK_EVERY == 0:
+                    self._evict()
+        except Exception as e:
+            print(f"Embedding cache write error: {e}")
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.disk_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else None,
+                "memory_entries": len(self._lru),
+            }
@@ -0,0 +1,347 @@
+import random
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, InvalidArgument, NotFound
+
+from clara_app.services.storage_backend import SERVER_TIMESTAMP, StorageBackend, StorageUnavailable, WriteOutcomeUnknown, utc_now
+
+# Firestore rejects batches with more than 500 writes.
+MAX_BATCH_WRITES = 500
+# Commit errors the server returns for a batch it rejected outright. Batches are
+# atomic, so after one of these nothing was written and the ops can be re-sent
+# one by one. Anything else (DeadlineExceeded, Unavailable, ...) may have landed.
+NOT_COMMITTED_ERRORS = (InvalidArgument, AlreadyExists, FailedPrecondition, NotFound)
+
+def _has_increment(data: dict) -> bool:
+    return any(isinstance(v, firestore.Increment) for v in data.values())
+
+def _to_firestore(fields: dict) -> dict:
+    """Swap the backend-neutral SERVER_TIMESTAMP placeholder for Firestore's sentinel."""
+    converted = {}
+    for key, value in fields.items():
+        if value is SERVER_TIMESTAMP:
+            converted[key] = firestore.SERVER_TIMESTAMP
+        elif isinstance(value, dict):
+            converted[key] = _to_firestore(value)
+        else:
+            converted[key] = value
+    return converted
+
+def delete_collection(db, collection_ref, on_deleted=None, page_size: int = 500) -> None:
+    """
+    Delete every document in a collection with a BulkWriter, which sends deletes
+    in parallel batches and retries throttled writes on its own.
+    Firestore does not cascade delete subcollections when parent docs are deleted,
+    so account deletion must explicitly remove subcollection documents too.
+    """
+    if db is None or collection_ref is None:
+        return
+    if not hasattr(db, "bulk_writer"):
+        _delete_collection_in_batches(db, collection_ref, on_deleted)
+        return
+
+    bulk = db.bulk_writer()
+    if on_deleted is not None:
+        bulk.on_write_result(lambda ref, result, writer: on_deleted(1))
+    try:
+        # list_documents only fetches references (no field data), page by page.
+        for ref in collection_ref.list_documents(page_size=page_size):
+            bulk.delete(ref)
+    finally:
+        bulk.close()
+
+def _delete_collection_in_batches(db, collection_ref, on_deleted=None, batch_size: int = 250) -> None:
+    """Serial WriteBatch fallback for clients without BulkWriter."""
+    while True:
+        try:
+            docs = collection_ref.limit(batch_size).get()
+        except Exception:
+            return
+        if not docs:
+            return
+        try:
+            batch = db.batch()
+            for d in docs:
+                batch.delete(d.reference)
+            batch.commit()
+        except Exception:
+            for d in docs:
+                try:
+                    d.reference.delete()
+                except Exception:
+                    pass
+        if on_deleted is not None:
+            on_deleted(len(docs))
+        if len(docs) < batch_size:
+            return
+
+class FirestoreBackend(StorageBackend):
+    """StorageBackend on Cloud Firestore, using the collection layout described on StorageBackend."""
+
+    name = "firestore"
+
+    def __init__(self, client_factory, metric_shards: int = 10, call_options=None):
+        # client_factory returns a firestore.Client or None (see storage.get_db);
+        # call_options returns retry/timeout kwargs for each get/set/commit.
+        self._client_factory = client_factory
+        self._call_options = call_options or dict
+        self.metric_shards = max(1, int(metric_shards))
+
+    def client(self):
+        db = self._client_factory()
+        if db is None:
+            raise StorageUnavailable("Firestore client is unavailable")
+        return db
+
+    # --- refs ---
+    def chat_ref(self, chat_id: str):
+        return self.client().collection("chats").document(chat_id)
+
+    def messages_ref(self, chat_id: str):
+        return self.chat_ref(chat_id).collection("messages")
+
+    def archives_ref(self, chat_id: str):
+        return self.chat_ref(chat_id).collection("archives")
+
+    def usage_ref(self, chat_id: str):
+        return self.client().collection("usage").document(chat_id)
+
+    def daily_ref(self, chat_id: str, date_str: str):
+        return self.usage_ref(chat_id).collection("daily").document(date_str)
+
+    def user_ref(self, user_id: str):
+        return self.client().collection("users").document(user_id)
+
+    def beta_key_ref(self, code: str):
+        return self.client().collection("beta_keys").document(code)
+
+    def metrics_ref(self, doc_id: str):
+        return self.client().collection("metrics").document(doc_id)
+
+    def metric_shard_ref(self, doc_id: str, shard: int | None = None):
+        """
+        metrics/{doc_id}/shards/{n}. Increments land on a random shard so no single
+        document takes more than its share of the write rate.
+        """
+        if shard is None:
+            shard = random.randrange(self.metric_shards)
+        return self.metrics_ref(doc_id).collection("shards").document(str(shard))
+
+    def _get_dict(self, ref, fields=None):
+        doc = ref.get(field_paths=fields, **self._call_options())
+        return (doc.to_dict() or {}) if doc.exists else None
+
+    # --- chats ---
+    def get_chat(self, chat_id, fields=None):
+        return self._get_dict(self.chat_ref(chat_id), fields)
+
+    def merge_chat(self, chat_id, fields):
+        self.chat_ref(chat_id).set(_to_firestore(fields), merge=True, **self._call_options())
+
+    def delete_chat(self, chat_id, on_deleted=None):
+        delete_collection(self.client(), self.messages_ref(chat_id), on_deleted)
+        delete_collection(self.client(), self.archives_ref(chat_id), on_deleted)
+        self.chat_ref(chat_id).delete()
+        if on_deleted is not None:
+            on_deleted(1)
+
+    # --- messages ---
+    def add_message(self, chat_id, message):
+        ref, data, merge = self._write_spec("add_message", (chat_id, message))
+        self._write_one(ref, data, merge)
+
+    def list_messages(self, chat_id, *, after_ts=None, before=None, limit=60):
+        q = self.messages_ref(chat_id)
+        if after_ts:
+            q = q.where("ts", ">", after_ts)
+        q = q.order_by("ts", direction=firestore.Query.DESCENDING).order_by("__name__", direction=firestore.Query.DESCENDING)
+        if before is not None:
+            before_ts, before_id = before
+            q = q.start_after({"ts": before_ts, "__name__": before_id})
+        return [dict(d.to_dict() or {}, id=d.id) for d in q.limit(limit).get(**self._call_options())]
+
+    def iter_messages(self, chat_id, page_size=500):
+        q = self.messages_ref(chat_id).order_by("ts").limit(page_size)
+        cursor = None
+        while True:
+            page = (q.start_after(cursor) if cursor is not None else q).get(**self._call_options())
+            for d in page:
+                yield dict(d.to_dict() or {}, id=d.id)
+            if len(page) < page_size:
+                return
+            cursor = page[-1]
+
+    def iter_chat_ids(self):
+        # list_documents also returns ids that only exist as a parent of messages.
+        for ref in self.client().collection("chats").list_documents(page_size=500):
+            yield ref.id
+
+    # --- message archives ---
+    def list_archives(self, chat_id, *, until_ts=None, limit=2):
+        q = self.archives_ref(chat_id)
+        if until_ts is not None:
+            q = q.where("startTs", "<=", until_ts)
+        q = q.order_by("startTs", direction=firestore.Query.DESCENDING).limit(limit)
+        return [dict(d.to_dict() or {}, id=d.id) for d in q.get(**self._call_options())]
+
+    def iter_archives(self, chat_id):
+        for d in self.archives_ref(chat_id).order_by("startTs").stream():
+            yield dict(d.to_dict() or {}, id=d.id)
+
+    def write_archive(self, chat_id, archive):
+        batch = self.client().batch()
+        data = {k: v for k, v in archive.items() if k != "id"}
+        batch.set(self.archives_ref(chat_id).document(archive["id"]), data)
+        for message in archive["messages"]:
+            batch.delete(self.messages_ref(chat_id).document(message["id"]))
+        batch.commit(**self._no_retry())
+
+    # --- usage ---
+    def get_daily_count(self, chat_id, date_str):
+        data = self._get_dict(self.daily_ref(chat_id, date_str))
+        return int((data or {}).get("count") or 0)
+
+    def increment_daily_count(self, chat_id, date_str, amount=1):
+        ref, data, merge = self._write_spec("increment_daily_count", (chat_id, date_str, amount))
+        self._write_one(ref, data, merge)
+
+    def consume_daily_quota(self, chat_id, date_str, amount=1, limit=None):
+        ref = self.daily_ref(chat_id, date_str)
+
+        @firestore.transactional
+        def _check_and_increment(transaction):
+            snap = ref.get(transaction=transaction)
+            count = int(((snap.to_dict() or {}) if snap.exists else {}).get("count") or 0)
+            if limit is not None and count + amount > limit:
+                return False, count
+            transaction.set(ref, {"count": count + int(amount), "updatedAt": utc_now()}, merge=True)
+            return True, count + int(amount)
+
+        return _check_and_increment(self.client().transaction())
+
+    def iter_daily_usage(self, chat_id):
+        for d in self.usage_ref(chat_id).collection("daily").stream():
+            yield d.id, d.to_dict() or {}
+
+    def delete_usage(self, chat_id, on_deleted=None):
+        usage_ref = self.usage_ref(chat_id)
+        delete_collection(self.client(), usage_ref.collection("daily"), on_deleted)
+        usage_ref.delete()
+        if on_deleted is not None:
+            on_deleted(1)
+
+    # --- users ---
+    def get_user(self, user_id):
+        return self._get_dict(self.user_ref(user_id))
+
+    def merge_user(self, user_id, fields):
+        self.user_ref(user_id).set(_to_firestore(fields), merge=True, **self._call_options())
+
+    def delete_user(self, user_id, on_deleted=None):
+        self.user_ref(user_id).delete()
+        if on_deleted is not None:
+            on_deleted(1)
+
+    # --- beta keys ---
+    def get_beta_key(self, code):
+        return self._get_dict(self.beta_key_ref(code))
+
+    def merge_beta_key(self, code, fields):
+        self.beta_key_ref(code).set(_to_firestore(fields), merge=True, **self._call_options())
+
+    # --- metrics ---
+    def increment_metric(self, doc_id, field, amount=1):
+        self.increment_metrics(doc_id, {field: amount})
+
+    def increment_metrics(self, doc_id, counts):
+        ref, data, merge = self._write_spec("increment_metrics", (doc_id, counts))
+        self._write_one(ref, data, merge)
+
+    def get_metrics(self, doc_id):
+        """Sum the shard docs, plus any totals left on the pre-sharding parent doc."""
+        totals = {}
+        base = self._get_dict(self.metrics_ref(doc_id)) or {}
+        shards = self.metrics_ref(doc_id).collection("shards").get(**self._call_options())
+        for data in [base] + [d.to_dict() or {} for d in shards]:
+            for field, value in data.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[field] = totals.get(field, 0) + value
+        return totals
+
+    # --- batching ---
+    def _write_spec(self, method: str, args: tuple):
+        """
+        Translate a buffered write op into (ref, data, merge) for a WriteBatch.
+        merge=None means create: the write is skipped if the doc already exists.
+        """
+        if method == "add_message":
+            chat_id, message = args
+            data = {k: v for k, v in message.items() if k != "id"}
+            if message.get("id"):
+                # Client-chosen id: a retried write of the same message is a no-op.
+                return self.messages_ref(chat_id).document(message["id"]), data, None
+            return self.messages_ref(chat_id).document(), data, False
+        if method == "increment_daily_count":
+            chat_id, date_str, amount = args
+            return (
+                self.daily_ref(chat_id, date_str),
+                {"count": firestore.Increment(int(amount)), "updatedAt": utc_now()},
+                True,
+            )
+        if method == "increment_metric":
+            doc_id, field, amount = args
+            return self._write_spec("increment_metrics", (doc_id, {field: amount}))
+        if method == "increment_metrics":
+            doc_id, counts = args
+            return (
+                self.metric_shard_ref(doc_id),
+                {field: firestore.Increment(int(amount)) for field, amount in counts.items()},
+                True,
+            )
+        if method == "merge_chat":
+            chat_id, fields = args
+            return self.chat_ref(chat_id), _to_firestore(fields), True
+        raise ValueError(f"Unsupported buffered write: {method}")
+
+    def _no_retry(self) -> dict:
+        # A retried commit can re-apply one that landed but timed out (Increment ops double count).
+        return {**self._call_options(), "retry": None}
+
+    def _write_one(self, ref, data, merge):
+        try:
+            if merge is None:
+                ref.create(data, **self._call_options())
+            else:
+                options = self._no_retry() if _has_increment(data) else self._call_options()
+                ref.set(data, merge=merge, **options)
+        except AlreadyExists:
+            pass
+
+    def apply_writes(self, ops):
+        db = self.client()
+        specs = [self._write_spec(method, args) for method, args in ops]
+        unknown = None
+        for start in range(0, len(specs), MAX_BATCH_WRITES):
+            chunk = specs[start:start + MAX_BATCH_WRITES]
+            batch = db.batch()
+            for ref, data, merge in chunk:
+                if merge is None:
+                    batch.create(ref, data)
+                else:
+                    batch.set(ref, data, merge=merge)
+            try:
+                batch.commit(**self._no_retry())
+            except NOT_COMMITTED_ERRORS as e:
+                print(f"Error committing batched writes: {e}")
+                # Nothing was written: fall back to individual writes so one bad op
+                # (or an already written message) doesn't drop the rest
+                for ref, data, merge in chunk:
+                    try:
+                        self._write_one(ref, data, merge)
+                    except Exception:
+                        pass
+            except Exception as e:
+                # The batch may have been applied; re-sending could double count.
+                print(f"Batched writes may not have been applied: {e}")
+                unknown = e
+        if unknown is not None:
+            raise WriteOutcomeUnknown(str(unknown)) from unknown
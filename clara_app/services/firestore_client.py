@@ -0,0 +1,182 @@
+import asyncio
+import inspect
+import threading
+import time
+import firebase_admin
+from google.api_core import retry as retries
+from google.cloud import firestore as gcloud_firestore
+
+# Probe failures in a row before the client is replaced.
+PROBE_FAILURES_BEFORE_ROTATE = 2
+
+class FirestoreClientManager:
+    """
+    Holds one process-wide Firestore client (one gRPC channel) instead of
+    resolving it on every storage call.
+    A daemon thread reads a tiny doc every `probe_interval` seconds; after
+    consecutive failures the client is rebuilt on a fresh channel, which is what
+    the old per-call get_db() was trying to guard against without detecting it.
+    `call_options()` gives storage calls a shared timeout and retry policy.
+    The AsyncClient used by the chat-view loader is held here too and is
+    replaced together with the sync client; `async_call_options()` is its
+    retry/timeout counterpart.
+    """
+
+    def __init__(self, init_app, probe_interval: float = 60, call_timeout: float = 10, on_rotate=None):
+        # init_app() initialises the default firebase_admin app (raising on bad credentials)
+        self._init_app = init_app
+        self.probe_interval = probe_interval
+        self.call_timeout = call_timeout
+        self._on_rotate = on_rotate
+        self._client = None
+        self._async_client = None
+        self._async_loop = None
+        self._created_at = None
+        self._lock = threading.Lock()
+        self._probe_thread = None
+        self.rotations = 0
+        self.probe_failures = 0
+        self.last_probe_ok = None
+        self._retry = retries.Retry(
+            predicate=retries.if_transient_error,
+            initial=0.1,
+            maximum=2.0,
+            multiplier=2.0,
+            timeout=call_timeout,
+        )
+
+    def _credentials(self):
+        if not firebase_admin._apps:
+            self._init_app()
+        app = firebase_admin.get_app()
+        credential = app.credential.get_credential()
+        return app.project_id or getattr(credential, "project_id", None), credential
+
+    def _build_client(self):
+        project, credential = self._credentials()
+        # Built directly rather than via firebase_admin.firestore.client(), which
+        # caches one client per app and so could never hand out a fresh channel.
+        return gcloud_firestore.Client(project=project, credentials=credential)
+
+    def client(self):
+        """The shared client, created on first use. Raises if Firebase can't be initialised."""
+        client = self._client
+        if client is not None:
+            return client
+        with self._lock:
+            if self._client is None:
+                self._client = self._build_client()
+                self._created_at = time.monotonic()
+                self._start_probe()
+            return self._client
+
+    def async_client(self):
+        """
+        The shared AsyncClient, created on first use. Call from the event loop that
+        will run its calls: its channel binds to that loop, which is also where it is
+        closed after a rotation. Rebuilt after a rotation.
+        """
+        self.client()  # initialises the app and starts the health probe
+        client = self._async_client
+        if client is not None:
+            return client
+        with self._lock:
+            if self._async_client is None:
+                project, credential = self._credentials()
+                self._async_client = gcloud_firestore.AsyncClient(project=project, credentials=credential)
+                self._async_loop = asyncio.get_running_loop()
+            return self._async_client
+
+    def call_options(self) -> dict:
+        """Keyword arguments (retry, timeout) for Firestore get/set/commit calls."""
+        return {"retry": self._retry, "timeout": self.call_timeout}
+
+    def async_call_options(self, timeout: float | None = None) -> dict:
+        """call_options() for AsyncClient calls, optionally with a shorter deadline."""
+        timeout = timeout or self.call_timeout
+        retry = retries.AsyncRetry(
+            predicate=retries.if_transient_error,
+            initial=0.1,
+            maximum=1.0,
+            multiplier=2.0,
+            timeout=timeout,
+        )
+        return {"retry": retry, "timeout": timeout}
+
+    def rotate(self, reason: str = "") -> bool:
+        """Replace the client with a new one. The old one is closed once in-flight calls have had time to finish."""
+        try:
+            fresh = self._build_client()
+        except Exception as e:
+            print(f"Firestore client rotation failed: {e}")
+            return False
+        with self._lock:
+            old, self._client = self._client, fresh
+            # The async client is rebuilt lazily on the loader's event loop.
+            old_async, self._async_client = self._async_client, None
+            old_loop, self._async_loop = self._async_loop, None
+            self._created_at = time.monotonic()
+            self.rotations += 1
+        print(f"Rotated Firestore client{f' ({reason})' if reason else ''}")
+        if old is not None and hasattr(old, "close"):
+            timer = threading.Timer(self.call_timeout * 2, old.close)
+            timer.daemon = True
+            timer.start()
+        if old_async is not None and old_loop is not None and not old_loop.is_closed():
+            # Its aio channel can only be closed from the loop it is bound to.
+            asyncio.run_coroutine_threadsafe(self._close_async_later(old_async), old_loop)
+        if self._on_rotate is not None:
+            try:
+                self._on_rotate()
+            except Exception:
+                pass
+        return True
+
+    async def _close_async_later(self, client):
+        await asyncio.sleep(self.call_timeout * 2)
+        try:
+            result = client.close()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f"Error closing rotated async Firestore client: {e}")
+
+    def probe(self) -> bool:
+        """One cheap read on the current client. Returns True if it succeeded."""
+        client = self._client
+        if client is None:
+            return False
+        try:
+            client.collection("_health").document("probe").get(timeout=self.call_timeout, retry=None)
+            ok = True
+        except Exception as e:
+            print(f"Firestore health probe failed: {e}")
+            ok = False
+        with self._lock:
+            self.last_probe_ok = ok
+            self.probe_failures = 0 if ok else self.probe_failures + 1
+            failures = self.probe_failures
+        if failures >= PROBE_FAILURES_BEFORE_ROTATE and self.rotate(f"{failures} failed probes"):
+            with self._lock:
+                self.probe_failures = 0
+        return ok
+
+    def _start_probe(self):
+        if self.probe_interval <= 0 or self._probe_thread is not None:
+            return
+        self._probe_thread = threading.Thread(target=self._probe_loop, name="clara-firestore-probe", daemon=True)
+        self._probe_thread.start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.probe_interval)
+            self.probe()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rotations": self.rotations,
+                "probe_failures": self.probe_failures,
+                "last_probe_ok": self.last_probe_ok,
+                "client_age_seconds": None if self._created_at is None else round(time.monotonic() - self._created_at),
+            }
@@ -0,0 +1,372 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import numpy as np
+
+try:
+    # Optional: approximate search for large namespaces (pip install hnswlib).
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+from clara_app.services.vector_backend import VectorBackend, VectorMatch, matches_filter
+
+# Namespaces with at least this many live vectors are searched through an HNSW
+# graph when hnswlib is installed; smaller ones use exact brute force.
+HNSW_MIN_VECTORS = 20_000
+# Rewrite a namespace's files once this share of its rows are deleted/overwritten.
+COMPACT_DEAD_RATIO = 0.5
+COMPACT_MIN_ROWS = 1_000
+
+def _normalize(values, dimension: int) -> np.ndarray:
+    matrix = np.asarray(values, dtype=np.float32).reshape(-1, dimension)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+class _Namespace:
+    """
+    One namespace on disk, in its own directory:
+    - manifest.json: the current file generation
+    - vectors.{gen}.f32: unit-normalised float32 rows, append-only, memory-mapped for queries
+    - log.{gen}.jsonl: append-only {"id", "row", "metadata"} and {"id", "deleted"} records
+    - hnsw.{gen}.bin (+ .json): optional hnswlib graph whose labels are row numbers
+    Overwrites and deletes leave dead rows behind; compaction writes a new
+    generation with only live rows and switches the manifest atomically.
+    """
+
+    def __init__(self, path: str, dimension: int, hnsw_min_vectors: int):
+        self.path = path
+        self.dimension = dimension
+        self.hnsw_min_vectors = hnsw_min_vectors
+        self.lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    # --- files ---
+    def _file(self, name: str, generation: int | None = None) -> str:
+        stem, ext = name.split(".", 1)
+        return os.path.join(self.path, f"{stem}.{self.generation if generation is None else generation}.{ext}")
+
+    def _load(self):
+        manifest = os.path.join(self.path, "manifest.json")
+        self.generation = 0
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                self.generation = json.load(f)["generation"]
+
+        row_bytes = 4 * self.dimension
+        vectors_path = self._file("vectors.f32")
+        if os.path.exists(vectors_path) and os.path.getsize(vectors_path) % row_bytes:
+            # A write was cut short; drop the partial row.
+            with open(vectors_path, "r+b") as f:
+                f.truncate(os.path.getsize(vectors_path) // row_bytes * row_bytes)
+
+        self.ids = []       # row -> id, None once dead
+        self.metadata = []  # row -> metadata, None once dead
+        self.rows = {}      # id -> live row
+        log_path = self._file("log.jsonl")
+        if os.path.exists(log_path):
+            with open(log_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn final line
+                    if record.get("deleted"):
+                        self._kill(self.rows.pop(record["id"], None))
+                    else:
+                        self._place(record["id"], record["row"], record.get("metadata") or {})
+        self._remap()
+        self._hnsw = None
+        self._hnsw_dirty = False
+
+    def _remap(self):
+        path = self._file("vectors.f32")
+        n = os.path.getsize(path) // (4 * self.dimension) if os.path.exists(path) else 0
+        self.row_count = n
+        if n:
+            self.vectors = np.memmap(path, dtype=np.float32, mode="r", shape=(n, self.dimension))
+        else:
+            self.vectors = np.empty((0, self.dimension), dtype=np.float32)
+
+    def _kill(self, row):
+        if row is not None and row < len(self.ids):
+            self.ids[row] = None
+            self.metadata[row] = None
+
+    def _place(self, vector_id, row, metadata):
+        if row >= len(self.ids):
+            grow = row + 1 - len(self.ids)
+            self.ids.extend([None] * grow)
+            self.metadata.extend([None] * grow)
+        old = self.rows.get(vector_id)
+        if old is not None and old != row:
+            self._kill(old)
+        self.ids[row] = vector_id
+        self.metadata[row] = metadata
+        self.rows[vector_id] = row
+
+    def live_count(self) -> int:
+        return len(self.rows)
+
+    # --- writes ---
+    def upsert(self, vectors):
+        if not vectors:
+            return
+        matrix = _normalize([v["values"] for v in vectors], self.dimension)
+        with self.lock:
+            start = self.row_count
+            with open(self._file("vectors.f32"), "ab") as f:
+                f.write(matrix.tobytes())
+            replaced = [self.rows[v["id"]] for v in vectors if v["id"] in self.rows]
+            with open(self._file("log.jsonl"), "a") as f:
+                for i, v in enumerate(vectors):
+                    metadata = dict(v.get("metadata") or {})
+                    f.write(json.dumps({"id": v["id"], "row": start + i, "metadata": metadata}) + "\n")
+                    self._place(v["id"], start + i, metadata)
+            self._remap()
+            if self._hnsw is not None:
+                self._hnsw_add(matrix, list(range(start, start + len(vectors))))
+                for row in replaced:
+                    self._hnsw_delete(row)
+            self._maybe_compact()
+
+    def update_metadata(self, vector_id, metadata):
+        with self.lock:
+            row = self.rows.get(vector_id)
+            if row is None:
+                return
+            merged = {**self.metadata[row], **metadata}
+            with open(self._file("log.jsonl"), "a") as f:
+                f.write(json.dumps({"id": vector_id, "row": row, "metadata": merged}) + "\n")
+            self.metadata[row] = merged
+
+    def delete(self, ids):
+        with self.lock:
+            dead = [(vid, self.rows.pop(vid)) for vid in ids if vid in self.rows]
+            if not dead:
+                return
+            with open(self._file("log.jsonl"), "a") as f:
+                for vid, row in dead:
+                    f.write(json.dumps({"id": vid, "deleted": True}) + "\n")
+                    self._kill(row)
+                    if self._hnsw is not None:
+                        self._hnsw_delete(row)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        dead = self.row_count - self.live_count()
+        if self.row_count >= COMPACT_MIN_ROWS and dead > COMPACT_DEAD_RATIO * self.row_count:
+            self.compact()
+
+    def compact(self):
+        with self.lock:
+            live = sorted(self.rows.values())
+            new_generation = self.generation + 1
+            with open(self._file("vectors.f32", new_generation), "wb") as f:
+                for start in range(0, len(live), 4096):
+                    f.write(np.asarray(self.vectors[live[start:start + 4096]], dtype=np.float32).tobytes())
+            with open(self._file("log.jsonl", new_generation), "w") as f:
+                for new_row, old_row in enumerate(live):
+                    f.write(json.dumps({"id": self.ids[old_row], "row": new_row, "metadata": self.metadata[old_row]}) + "\n")
+            manifest_tmp = os.path.join(self.path, "manifest.json.tmp")
+            with open(manifest_tmp, "w") as f:
+                json.dump({"generation": new_generation}, f)
+            old_generation = self.generation
+            os.replace(manifest_tmp, os.path.join(self.path, "manifest.json"))
+            self.vectors = None  # release the old mapping before its file goes
+            for name in ("vectors.f32", "log.jsonl", "hnsw.bin", "hnsw.json"):
+                path = self._file(name, old_generation)
+                if os.path.exists(path):
+                    os.remove(path)
+            self._load()
+
+    # --- HNSW ---
+    def _hnsw_add(self, matrix, labels):
+        if self._hnsw.get_current_count() + len(labels) > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(max(2 * self._hnsw.get_max_elements(), self._hnsw.get_current_count() + len(labels)))
+        self._hnsw.add_items(matrix, labels)
+        self._hnsw_dirty = True
+
+    def _hnsw_delete(self, row):
+        try:
+            self._hnsw.mark_deleted(row)
+            self._hnsw_dirty = True
+        except RuntimeError:
+            pass
+
+    def _ensure_hnsw(self):
+        """Load or build the graph once the namespace is big enough (and hnswlib is installed)."""
+        if self._hnsw is not None or hnswlib is None or self.live_count() < self.hnsw_min_vectors:
+            return self._hnsw
+        graph_path, info_path = self._file("hnsw.bin"), self._file("hnsw.json")
+        index = hnswlib.Index(space="ip", dim=self.dimension)
+        if os.path.exists(graph_path) and os.path.exists(info_path):
+            with open(info_path) as f:
+                info = json.load(f)
+            if info.get("rows") == self.row_count and info.get("live") == self.live_count():
+                index.load_index(graph_path, max_elements=max(info["rows"] * 2, 1024))
+                index.set_ef(128)
+                self._hnsw = index
+                return index
+        live = sorted(self.rows.values())
+        index.init_index(max_elements=max(self.row_count * 2, 1024), ef_construction=200, M=16)
+        for start in range(0, len(live), 4096):
+            chunk = live[start:start + 4096]
+            index.add_items(np.asarray(self.vectors[chunk]), chunk)
+        index.set_ef(128)
+        self._hnsw = index
+        self._hnsw_dirty = True
+        self.flush()
+        return index
+
+    def flush(self):
+        """Persist the HNSW graph if it changed since it was last saved."""
+        with self.lock:
+            if self._hnsw is None or not self._hnsw_dirty:
+                return
+            self._hnsw.save_index(self._file("hnsw.bin"))
+            with open(self._file("hnsw.json"), "w") as f:
+                json.dump({"rows": self.row_count, "live": self.live_count()}, f)
+            self._hnsw_dirty = False
+
+    # --- reads ---
+    def query(self, vector, top_k, filter=None, include_values=False):
+        q = _normalize(vector, self.dimension)[0]
+        with self.lock:
+            if filter:
+                candidates = [row for row, md in enumerate(self.metadata) if md is not None and matches_filter(md, filter)]
+            else:
+                candidates = sorted(self.rows.values())
+            if not candidates or top_k <= 0:
+                return []
+            k = min(top_k, len(candidates))
+            hnsw = self._ensure_hnsw()
+            if hnsw is not None:
+                allowed = set(candidates)
+                try:
+                    labels, distances = hnsw.knn_query(q, k=k, filter=allowed.__contains__ if filter else None)
+                    ranked = [(int(row), 1.0 - float(d)) for row, d in zip(labels[0], distances[0])]
+                except RuntimeError:
+                    # Too few reachable matches under this filter; fall back to exact search.
+                    ranked = None
+            else:
+                ranked = None
+            if ranked is None:
+                rows = np.asarray(candidates)
+                scores = np.asarray(self.vectors[rows]) @ q
+                top = np.argpartition(-scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+                top = top[np.argsort(-scores[top])]
+                ranked = [(int(rows[i]), float(scores[i])) for i in top]
+            return [
+                VectorMatch(
+                    self.ids[row],
+                    score,
+                    dict(self.metadata[row]),
+                    self.vectors[row].tolist() if include_values else None,
+                )
+                for row, score in ranked
+            ]
+
+    def list_ids(self, prefix=None):
+        with self.lock:
+            return sorted(vid for vid in self.rows if not prefix or vid.startswith(prefix))
+
+    def fetch(self, ids):
+        with self.lock:
+            return {
+                vid: VectorMatch(vid, None, dict(self.metadata[row]), self.vectors[row].tolist())
+                for vid in ids
+                if (row := self.rows.get(vid)) is not None
+            }
+
+class LocalVectorBackend(VectorBackend):
+    """
+    In-process VectorBackend persisted under `root` (one directory per namespace).
+    Exact NumPy brute force over memory-mapped vectors, switching to an HNSW
+    graph for namespaces of HNSW_MIN_VECTORS+ when hnswlib is installed. Meant for
+    offline runs, benchmarks and small single-node deployments.
+    Stored values are unit-normalised (scores are cosine similarity either way).
+    """
+
+    name = "local"
+
+    def __init__(self, root: str, dimension: int, hnsw_min_vectors: int = HNSW_MIN_VECTORS):
+        self.root = root
+        self.dimension = dimension
+        self.hnsw_min_vectors = hnsw_min_vectors
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        atexit.register(self.flush)
+
+    def _path(self, namespace: str) -> str:
+        # A digest keeps distinct namespaces (e.g. "a@b.com" and "a_b.com") in distinct
+        # directories, with names that are safe and fixed-length on any filesystem.
+        if not namespace:
+            return os.path.join(self.root, "default")
+        digest = hashlib.sha256(namespace.encode("utf-8")).hexdigest()
+        path = os.path.join(self.root, f"ns-{digest}")
+        # Directories from the older naming scheme are adopted when that name was the
+        # namespace itself, so no two namespaces could have shared it.
+        legacy = os.path.join(self.root, f"ns-{namespace}")
+        if re.fullmatch(r"[A-Za-z0-9._-]+", namespace) and os.path.isdir(legacy) and not os.path.exists(path):
+            os.replace(legacy, path)
+        return path
+
+    def _namespace(self, namespace: str, create: bool = False):
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                path = self._path(namespace)
+                if not create and not os.path.isdir(path):
+                    return None
+                ns = _Namespace(path, self.dimension, self.hnsw_min_vectors)
+                self._namespaces[namespace] = ns
+            return ns
+
+    def upsert(self, vectors, namespace=""):
+        self._namespace(namespace, create=True).upsert(list(vectors))
+
+    def query(self, vector, top_k, namespace="", filter=None, include_values=False):
+        ns = self._namespace(namespace)
+        return ns.query(vector, top_k, filter, include_values) if ns else []
+
+    def list_ids(self, namespace="", prefix=None, page_size=100):
+        ns = self._namespace(namespace)
+        ids = ns.list_ids(prefix) if ns else []
+        for start in range(0, len(ids), page_size):
+            yield ids[start:start + page_size]
+
+    def fetch(self, ids, namespace=""):
+        ns = self._namespace(namespace)
+        return ns.fetch(ids) if ns else {}
+
+    def update_metadata(self, vector_id, metadata, namespace=""):
+        ns = self._namespace(namespace)
+        if ns:
+            ns.update_metadata(vector_id, metadata)
+
+    def delete(self, ids, namespace=""):
+        ns = self._namespace(namespace)
+        if ns:
+            ns.delete(ids)
+
+    def delete_namespace(self, namespace):
+        with self._lock:
+            self._namespaces.pop(namespace, None)
+            shutil.rmtree(self._path(namespace), ignore_errors=True)
+
+    def flush(self):
+        with self._lock:
+            namespaces = list(self._namespaces.values())
+        for ns in namespaces:
+            try:
+                ns.flush()
+            except Exception as e:
+                print(f"Vector index flush error: {e}")
@@ -1,19 +1,39 @@
 import streamlit as st
+import atexit
 import os
-from pinecone import Pinecone, ServerlessSpec
+from pinecone import Pinecone
 import google.generativeai as genai
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, NamedTuple, Optional
 import datetime
+import threading
+import numpy as np
+from collections import OrderedDict, deque
+import hashlib
 import uuid
-import time
+from concurrent.futures import ThreadPoolExecutor
 
-from clara_app.constants import API_KEY, PINECONE_API_KEY
+from clara_app.constants import API_KEY, PINECONE_API_KEY, PINECONE_INDEX_HOST, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MEMORY_ENTRIES, EMBEDDING_CACHE_DISK_ENTRIES, MEMORY_LEGACY_NAMESPACE_FALLBACK, VECTOR_BACKEND, VECTOR_INDEX_PATH, MEMORY_INGEST_WORKERS, MEMORY_INGEST_QUEUE_SIZE, MEMORY_INGEST_BATCH_SIZE, MEMORY_DEDUPE_RECENT, MEMORY_DEDUPE_SIMILARITY, MEMORY_CONSOLIDATE_AFTER_DAYS, MEMORY_CONSOLIDATE_SIMILARITY, MEMORY_RERANK_OVERFETCH, MEMORY_RERANK_BLEND, MEMORY_RERANK_HALF_LIFE_DAYS
+from clara_app.services import llm
+from clara_app.services.embedding_cache import EmbeddingCache
+from clara_app.services.memory_ingest import IngestQueue
+from clara_app.services.vector_backend import PineconeVectorBackend
 
 # Configuration
 INDEX_NAME = "clara-memory"
+EMBEDDING_MODEL = "models/embedding-001"
+EMBEDDING_DIMENSION = 768 # Gemini embedding-001 dimension
+# Memories used to share the default namespace, separated only by a username filter.
+LEGACY_NAMESPACE = ""
 
-_pinecone = None
-_index = None
+_vector_backend = None
+_warm_up_started = False
+
+# Identical text (e.g. "Continue", "My feelings of {tone}") is embedded once per host.
+_embedding_cache = EmbeddingCache(
+    memory_entries=EMBEDDING_CACHE_MEMORY_ENTRIES,
+    path=EMBEDDING_CACHE_PATH,
+    disk_entries=EMBEDDING_CACHE_DISK_ENTRIES,
+)
 
 @st.cache_resource
 def _get_client():
@@ -21,37 +41,90 @@ def _get_client():
         return None
     return Pinecone(api_key=PINECONE_API_KEY)
 
-def _get_index():
-    global _index
-    if _index is not None:
-        return _index
-
+@st.cache_resource(show_spinner=False)
+def _open_index():
+    """
+    Handle to the memory index, opened straight from its host
+    (PINECONE_INDEX_HOST) so no control-plane call is needed. Without it the
+    host is looked up once per process. The index itself is provisioned by
+    scripts/bootstrap_pinecone_index.py, never here. Failures raise, so they
+    aren't cached.
+    """
     pc = _get_client()
-    if not pc:
+    host = PINECONE_INDEX_HOST
+    if not host:
+        host = pc.describe_index(INDEX_NAME).host
+    return pc.Index(host=host)
+
+def _get_index():
+    if not PINECONE_API_KEY:
         return None
-        
-    # Check if index exists, create if not
-    existing_indexes = pc.list_indexes().names()
-    if INDEX_NAME not in existing_indexes:
-        try:
-            pc.create_index(
-                name=INDEX_NAME,
-                dimension=768, # Gemini embedding-001 dimension
-                metric="cosine",
-                spec=ServerlessSpec(
-                    cloud="aws",
-                    region="us-east-1"
-                )
-            )
-            # Wait for availability
-            while not pc.describe_index(INDEX_NAME).status['ready']:
-                time.sleep(1)
-        except Exception as e:
-            print(f"Index creation error: {e}")
-            return None
+    try:
+        return _open_index()
+    except Exception as e:
+        print(f"Pinecone index unavailable (run scripts/bootstrap_pinecone_index.py?): {e}")
+        return None
+
+def warm_up():
+    """
+    Open the vector store in a background thread at app start (once per
+    process), so the first chat turn doesn't pay for index discovery and the
+    connection setup.
+    """
+    global _warm_up_started
+    if _warm_up_started or not _vector_store_configured():
+        return
+    _warm_up_started = True
+
+    def _run():
+        backend = get_vector_backend()
+        if backend is not None and backend.name == "pinecone":
+            try:
+                # Cheap data-plane call; opens the pooled HTTPS connection.
+                backend.index.describe_index_stats()
+            except Exception as e:
+                print(f"Pinecone warm-up error: {e}")
 
-    _index = pc.Index(INDEX_NAME)
-    return _index
+    threading.Thread(target=_run, name="clara-memory-warmup", daemon=True).start()
+
+def _vector_store_configured() -> bool:
+    return VECTOR_BACKEND == "local" or bool(PINECONE_API_KEY)
+
+def get_vector_backend():
+    """
+    The VectorBackend memories are stored in (see CLARA_VECTOR_BACKEND), or None
+    when Pinecone is selected but unavailable.
+    """
+    global _vector_backend
+    if VECTOR_BACKEND == "local":
+        if _vector_backend is None:
+            # Imported lazily so Pinecone deployments don't load NumPy / hnswlib for nothing.
+            from clara_app.services.local_vector_backend import LocalVectorBackend
+            _vector_backend = LocalVectorBackend(VECTOR_INDEX_PATH, EMBEDDING_DIMENSION)
+        return _vector_backend
+
+    # The index handle is cached by Streamlit (_open_index); the wrapper is free.
+    index = _get_index()
+    return PineconeVectorBackend(index) if index is not None else None
+
+def _embed(text: str, task_type: str, title: Optional[str] = None) -> Optional[List[float]]:
+    """Embed text with EMBEDDING_MODEL, served from the embedding cache when possible."""
+    def compute():
+        kwargs = {"title": title} if title else {}
+        return genai.embed_content(model=EMBEDDING_MODEL, content=text, task_type=task_type, **kwargs)['embedding']
+
+    return _embedding_cache.get_or_compute(EMBEDDING_MODEL, task_type, text, compute, title=title)
+
+def _embed_many(texts: List[str], task_type: str, title: Optional[str] = None) -> List[Optional[List[float]]]:
+    """Embed several texts; whatever isn't cached goes to the API in one batched request."""
+    def compute_many(missing):
+        kwargs = {"title": title} if title else {}
+        return genai.embed_content(model=EMBEDDING_MODEL, content=missing, task_type=task_type, **kwargs)['embedding']
+
+    return _embedding_cache.get_many_or_compute(EMBEDDING_MODEL, task_type, texts, compute_many, title=title)
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    return _embedding_cache.stats()
 
 def get_embedding(text: str) -> Optional[List[float]]:
     """
@@ -62,98 +135,376 @@ def get_embedding(text: str) -> Optional[List[float]]:
     
     try:
         # Use the 'embedding-001' model optimized for texts
-        result = genai.embed_content(
-            model="models/embedding-001",
-            content=text,
-            task_type="retrieval_document",
-            title="Clara Memory"
-        )
-        return result['embedding']
+        return _embed(text, "retrieval_document", title="Clara Memory")
     except Exception as e:
         print(f"Embedding error: {e}")
         return None
 
-def store_memory(username: str, text: str, metadata: Dict[str, Any]):
-    """
-    Store a text memory with associated metadata in Pinecone.
-    """
-    if not text or not username:
-        return
+class MemoryRecord(NamedTuple):
+    """A memory waiting to be embedded and stored. Id and timestamp are fixed up front so retries overwrite."""
+    id: str
+    username: str
+    text: str
+    metadata: Dict[str, Any]
+    timestamp: str
 
-    embedding = get_embedding(text)
-    if not embedding:
-        return
+def _memory_records(username: str, items: List[tuple]) -> List[MemoryRecord]:
+    now = datetime.datetime.now().isoformat()
+    return [
+        MemoryRecord(_memory_id(username), username, text, metadata or {}, now)
+        for text, metadata in items
+        if text
+    ]
 
-    index = _get_index()
-    if not index:
-        return
-    
+def _memory_vector(record: MemoryRecord, embedding: List[float]) -> Dict[str, Any]:
     # Ensure standard metadata fields
     # Pinecone metadata values can be strings, numbers, booleans, or lists of strings
     safe_metadata = {}
-    for k, v in metadata.items():
+    for k, v in record.metadata.items():
         if isinstance(v, (str, int, float, bool)):
             safe_metadata[k] = v
         else:
             safe_metadata[k] = str(v)
             
-    safe_metadata["username"] = username
-    safe_metadata["timestamp"] = datetime.datetime.now().isoformat()
-    safe_metadata["text"] = text 
+    safe_metadata["username"] = record.username
+    safe_metadata["timestamp"] = record.timestamp
+    safe_metadata["text"] = record.text
     # Role is helpful for grounding
     if "role" not in safe_metadata:
-         safe_metadata["role"] = metadata.get("role", "user")
-    
-    memory_id = str(uuid.uuid4())
+         safe_metadata["role"] = record.metadata.get("role", "user")
     
+    return {
+        "id": record.id,
+        "values": embedding,
+        "metadata": safe_metadata
+    }
+
+def store_memory(username: str, text: str, metadata: Dict[str, Any]):
+    """
+    Store a text memory with associated metadata in Pinecone.
+    """
+    store_memories_batch(username, [(text, metadata)])
+
+def store_memories_batch(username: str, items: List[tuple]):
+    """
+    Store several (text, metadata) memories with one batched embedding request
+    and one vector upsert, e.g. both sides of a chat turn.
+    """
+    if not username or not API_KEY or not _vector_store_configured():
+        return
+    records = _memory_records(username, items)
+    if not records:
+        return
+    try:
+        failed = _store_records(records)
+        if failed:
+            print(f"Vector Store Error: {len(failed)} memories not stored")
+    except Exception as e:
+        print(f"Vector Store Error: {e}")
+
+class _RecentMemories:
+    """
+    Per-user ring buffer of the last `size` memories stored by this process
+    (unit vectors + metadata), used to catch near-duplicates ("Continue", repeated
+    check-ins) without querying the index. At most `max_users` users are tracked,
+    least recently active dropped first.
+    """
+
+    def __init__(self, size: int, threshold: float, max_users: int = 2000):
+        self.size = size
+        self.threshold = threshold
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, username: str, memory_id: str, vector: List[float], metadata: Dict[str, Any], pending=()):
+        """
+        Return (duplicate, entry). `duplicate` is the recent or `pending` entry this
+        memory nearly duplicates (same role and tone, cosine >= threshold), else None.
+        `entry` is this memory's own entry, for remember() once the memory is stored.
+        Entries are dicts with "id" and "metadata".
+        """
+        unit = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(unit)
+        if norm:
+            unit = unit / norm
+        key = (metadata.get("role"), metadata.get("tone"))
+        entry = {"id": memory_id, "key": key, "vector": unit, "metadata": metadata}
+        with self._lock:
+            recent = list(self._users.get(username) or ())
+        for candidate in reversed(recent + list(pending)):
+            if candidate["id"] == memory_id:
+                return None, entry  # a retry of a record already seen
+            if candidate["key"] == key and float(candidate["vector"] @ unit) >= self.threshold:
+                return candidate, entry
+        return None, entry
+
+    def remember(self, username: str, entries) -> None:
+        """Add the entries of memories that were stored."""
+        with self._lock:
+            recent = self._users.get(username)
+            if recent is None:
+                recent = self._users[username] = deque(maxlen=self.size)
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            self._users.move_to_end(username)
+            known = {entry["id"] for entry in recent}
+            recent.extend(entry for entry in entries if entry["id"] not in known)
+
+    def merge(self, entry, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Count a repeat on `entry`; returns the metadata fields that changed."""
+        with self._lock:
+            current = entry["metadata"]
+            # `timestamp` moves to the latest repeat so rerank's recency term treats a
+            # recurring memory as current; the first occurrence is kept as firstSeen.
+            changes = {
+                "repeats": int(current.get("repeats", 1)) + 1,
+                "lastSeen": metadata["timestamp"],
+                "timestamp": metadata["timestamp"],
+            }
+            if "firstSeen" not in current and current.get("timestamp"):
+                changes["firstSeen"] = current["timestamp"]
+            weight, new_weight = current.get("weight"), metadata.get("weight")
+            if isinstance(new_weight, (int, float)) and (not isinstance(weight, (int, float)) or new_weight > weight):
+                changes["weight"] = new_weight
+            entry["metadata"] = {**current, **changes}
+            return changes
+
+_recent_memories = _RecentMemories(MEMORY_DEDUPE_RECENT, MEMORY_DEDUPE_SIMILARITY) if MEMORY_DEDUPE_RECENT > 0 else None
+
+def _store_records(records: List[MemoryRecord]) -> List[MemoryRecord]:
+    """
+    Embed records (one batched request) and upsert them, one call per user
+    namespace. Near-duplicates of a user's recent memories aren't inserted; the
+    original gets its `repeats` count bumped instead. Returns the records that
+    weren't stored; raises if embedding fails.
+    """
+    backend = get_vector_backend()
+    if not backend:
+        raise RuntimeError("vector store unavailable")
+
+    embeddings = _embed_many([r.text for r in records], "retrieval_document", title="Clara Memory")
+    failed = [r for r, embedding in zip(records, embeddings) if not embedding]
+    by_user = {}
+    pending = {}
+    entries = {}
+    repeats = []
+    for record, embedding in zip(records, embeddings):
+        if not embedding:
+            continue
+        vector = _memory_vector(record, embedding)
+        duplicate = None
+        if _recent_memories:
+            # Records earlier in this batch count as recent too.
+            user_entries = entries.setdefault(record.username, [])
+            duplicate, entry = _recent_memories.check(record.username, record.id, embedding, vector["metadata"], pending=user_entries)
+        if duplicate is None:
+            if _recent_memories:
+                user_entries.append(entry)
+            pending[record.id] = vector
+            by_user.setdefault(record.username, []).append((record, vector))
+            continue
+        changes = _recent_memories.merge(duplicate, vector["metadata"])
+        if duplicate["id"] in pending:
+            pending[duplicate["id"]]["metadata"].update(changes)
+        else:
+            repeats.append((record.username, duplicate["id"], changes))
+
+    for username, pairs in by_user.items():
+        try:
+            backend.upsert([vector for _, vector in pairs], namespace=_namespace(username))
+        except Exception as e:
+            print(f"Vector Store Error: {e}")
+            failed.extend(record for record, _ in pairs)
+            continue
+        if _recent_memories:
+            # Only now can later repeats be merged into these vectors.
+            _recent_memories.remember(username, entries[username])
+    for username, memory_id, changes in repeats:
+        try:
+            backend.update_metadata(memory_id, changes, namespace=_namespace(username))
+        except Exception as e:
+            # Best effort: the original memory is stored, only its counter is behind.
+            print(f"Vector Update Error: {e}")
+    return failed
+
+# Semantic and pattern queries for one turn run side by side (see retrieve_context).
+_query_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="clara-memory-query")
+
+# Chat turns hand their memories to background workers so the reply isn't held
+# up by the embedding request and upsert (see enqueue_memories).
+_ingest_queue = IngestQueue(
+    _store_records,
+    workers=MEMORY_INGEST_WORKERS,
+    max_pending=MEMORY_INGEST_QUEUE_SIZE,
+    batch_size=MEMORY_INGEST_BATCH_SIZE,
+    name="clara-memory-ingest",
+) if MEMORY_INGEST_WORKERS > 0 else None
+if _ingest_queue is not None:
+    atexit.register(_ingest_queue.drain)
+
+def enqueue_memories(username: str, items: List[tuple]):
+    """
+    Like store_memories_batch, but returns immediately: the memories are embedded
+    and upserted by background workers in micro-batches, with retries. Falls back
+    to storing inline when background ingest is off or its queue is full.
+    """
+    if _ingest_queue is None:
+        store_memories_batch(username, items)
+        return
+    if not username or not API_KEY or not _vector_store_configured():
+        return
+    _ingest_queue.submit(_memory_records(username, items))
+
+def get_ingest_stats() -> Dict[str, Any]:
+    return _ingest_queue.stats() if _ingest_queue is not None else {}
+
+def _namespace(username: str) -> str:
+    """Each user's memories live in their own namespace, so queries only scan their vectors."""
+    return f"user-{username}"
+
+def _memory_id(username: str) -> str:
+    # The username prefix lets list_ids() page through one user's vectors.
+    return f"{username}#{uuid.uuid4()}"
+
+def iter_memories(username: str, page_size: int = 100):
+    """
+    Yield a user's stored memories as {"id", "text", "metadata"}, a page at a time.
+    The user's namespace is listed and fetched page by page. While the legacy
+    fallback is on, memories not yet moved out of the shared namespace follow:
+    username-prefixed ids by listing, older uuid-only ids via a filtered query
+    (which Pinecone caps at 1,000 matches when metadata is included).
+    """
+    if not username:
+        return
+    backend = get_vector_backend()
+    if not backend:
+        return
+
+    yield from _iter_listed(backend, _namespace(username), page_size=page_size)
+    if not MEMORY_LEGACY_NAMESPACE_FALLBACK:
+        return
+
+    prefix = f"{username}#"
+    yield from _iter_listed(backend, LEGACY_NAMESPACE, prefix=prefix, page_size=page_size)
     try:
-        index.upsert(
-            vectors=[
-                {
-                    "id": memory_id,
-                    "values": embedding,
-                    "metadata": safe_metadata
-                }
-            ]
+        # Any unit vector works as the probe; the filter does the selecting.
+        probe = [1.0] + [0.0] * (EMBEDDING_DIMENSION - 1)
+        matches = backend.query(
+            probe,
+            top_k=1000,
+            namespace=LEGACY_NAMESPACE,
+            filter={"username": {"$eq": username}}
         )
+        for match in matches:
+            if match.id.startswith(prefix):
+                continue
+            yield {"id": match.id, "text": match.metadata.get("text", ""), "metadata": match.metadata}
     except Exception as e:
-        print(f"Pinecone Store Error: {e}")
+        print(f"Vector Export Error: {e}")
+
+def _iter_listed(backend, namespace: str, prefix: Optional[str] = None, page_size: int = 100):
+    try:
+        for ids in backend.list_ids(namespace=namespace, prefix=prefix, page_size=page_size):
+            vectors = backend.fetch(ids, namespace=namespace)
+            for memory_id in ids:
+                vector = vectors.get(memory_id)
+                if vector is None:
+                    continue
+                yield {"id": memory_id, "text": vector.metadata.get("text", ""), "metadata": vector.metadata}
+    except Exception as e:
+        print(f"Vector List Error: {e}")
+
+def _query_user(backend, username: str, vector: List[float], top_k: int, tone: Optional[str] = None):
+    """
+    Top matches from the user's namespace. While the legacy fallback is on and the
+    namespace comes up short, the shared namespace is queried too (username filter).
+    """
+    tone_filter = {"tone": {"$eq": tone}} if tone else None
+    matches = backend.query(vector, top_k=top_k, namespace=_namespace(username), filter=tone_filter)
+    if MEMORY_LEGACY_NAMESPACE_FALLBACK and len(matches) < top_k:
+        legacy = backend.query(
+            vector,
+            top_k=top_k,
+            namespace=LEGACY_NAMESPACE,
+            filter={"username": {"$eq": username}, **(tone_filter or {})}
+        )
+        matches = sorted(matches + legacy, key=lambda m: m.score, reverse=True)[:top_k]
+    return matches
+
+def _parse_timestamp(value) -> Optional[datetime.datetime]:
+    try:
+        return datetime.datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+def rerank(
+    matches: List[Any],
+    k: int,
+    blend: Optional[Dict[str, float]] = None,
+    half_life_days: float = MEMORY_RERANK_HALF_LIFE_DAYS,
+    now: Optional[datetime.datetime] = None,
+) -> List[tuple]:
+    """
+    Order candidate matches by a blend of similarity, recency and emotional weight
+    and keep the best k, as (match, blended_score) pairs. Recency halves every
+    `half_life_days` since the memory's `timestamp`; weight is the 1-10 `weight`
+    scaled to 0-1. Missing timestamps/weights contribute nothing. `blend` maps
+    "similarity" / "recency" / "weight" to coefficients (MEMORY_RERANK_BLEND).
+    """
+    if not matches or k <= 0:
+        return []
+    blend = {**MEMORY_RERANK_BLEND, **(blend or {})}
+    now = now or datetime.datetime.now()
+
+    n = len(matches)
+    similarity = np.fromiter((m.score or 0.0 for m in matches), dtype=np.float64, count=n)
+    ages = np.full(n, np.inf)
+    weights = np.zeros(n)
+    for i, match in enumerate(matches):
+        ts = _parse_timestamp(match.metadata.get("timestamp"))
+        if ts is not None:
+            ages[i] = (now - ts).total_seconds() / 86400.0
+        weight = match.metadata.get("weight")
+        if isinstance(weight, (int, float)):
+            weights[i] = weight
+
+    recency = np.exp2(-np.maximum(ages, 0.0) / half_life_days)
+    scores = (
+        blend["similarity"] * similarity
+        + blend["recency"] * recency
+        + blend["weight"] * np.clip(weights / 10.0, 0.0, 1.0)
+    )
+    top = np.argsort(-scores, kind="stable")[:k]
+    return [(matches[i], float(scores[i])) for i in top]
 
 def search_memories(username: str, query_text: str, n_results: int = 5, min_relevance: float = 0.0) -> List[Dict[str, Any]]:
     """
-    Search for similar memories for a specific user.
+    Search for similar memories for a specific user. MEMORY_RERANK_OVERFETCH times
+    n_results candidates are fetched and re-ranked (see rerank).
     """
     if not query_text or not username:
         return []
 
     # specific embedding for query
     try:
-         query_embedding = genai.embed_content(
-            model="models/embedding-001",
-            content=query_text,
-            task_type="retrieval_query"
-        )['embedding']
+        query_embedding = _embed(query_text, "retrieval_query")
     except Exception:
         return []
+    if not query_embedding:
+        return []
 
-    index = _get_index()
-    if not index:
+    backend = get_vector_backend()
+    if not backend:
         return []
     
     try:
-        results = index.query(
-            vector=query_embedding,
-            top_k=n_results,
-            include_metadata=True,
-            filter={"username": {"$eq": username}}
-        )
+        matches = _query_user(backend, username, query_embedding, n_results * MEMORY_RERANK_OVERFETCH)
+        matches = [m for m in matches if m.score >= min_relevance]
         
         # Format results
         memories = []
-        for match in results.matches:
-            if match.score < min_relevance:
-                continue
-                
+        for match, _ in rerank(matches, n_results):
             memories.append({
                 "id": match.id,
                 "content": match.metadata.get("text", ""),
@@ -163,7 +514,7 @@ def search_memories(username: str, query_text: str, n_results: int = 5, min_rele
                 
         return memories
     except Exception as e:
-        print(f"Pinecone Search Error: {e}")
+        print(f"Vector Search Error: {e}")
         return []
 
 def search_patterns(username: str, tone: str, n_results: int = 5) -> List[Dict[str, Any]]:
@@ -171,8 +522,8 @@ def search_patterns(username: str, tone: str, n_results: int = 5) -> List[Dict[s
     Specific search to find memories with a matching emotional tone.
     Used for the 'Integrity Mirror' functionality.
     """
-    index = _get_index()
-    if not index:
+    backend = get_vector_backend()
+    if not backend:
         return []
 
     # Pinecone doesn't allow query without vector, so we use a "dummy" vector 
@@ -192,27 +543,17 @@ def search_patterns(username: str, tone: str, n_results: int = 5) -> List[Dict[s
     
     # Workaround: Use a generic query like "My feelings" to get memories, filtered by tone.
     try:
-         query_embedding = genai.embed_content(
-            model="models/embedding-001",
-            content=f"My feelings of {tone}",
-            task_type="retrieval_query"
-        )['embedding']
+        query_embedding = _embed(_pattern_probe(tone), "retrieval_query")
     except:
         return []
+    if not query_embedding:
+        return []
         
     try:
-        results = index.query(
-            vector=query_embedding,
-            top_k=n_results,
-            include_metadata=True,
-            filter={
-                "username": {"$eq": username},
-                "tone": {"$eq": tone}
-            }
-        )
+        matches = _query_user(backend, username, query_embedding, n_results * MEMORY_RERANK_OVERFETCH, tone=tone)
         
         memories = []
-        for match in results.matches:
+        for match, _ in rerank(matches, n_results):
             memories.append({
                 "id": match.id,
                 "content": match.metadata.get("text", ""),
@@ -221,5 +562,207 @@ def search_patterns(username: str, tone: str, n_results: int = 5) -> List[Dict[s
             
         return memories
     except Exception as e:
-        print(f"Pinecone Pattern Error: {e}")
+        print(f"Vector Pattern Error: {e}")
+        return []
+
+def _pattern_probe(tone: str) -> str:
+    # Generic text for "other times I felt this way"; see search_patterns.
+    return f"My feelings of {tone}"
+
+def retrieve_context(
+    username: str,
+    prompt: str,
+    tone: Optional[str] = None,
+    weight: int = 0,
+    n_results: int = 3,
+    pattern_min_weight: int = 7,
+    min_relevance: float = 0.0,
+) -> List[Dict[str, Any]]:
+    """
+    Memories to ground a chat turn: the semantic matches for the prompt plus, for
+    emotionally heavy turns (weight >= pattern_min_weight), memories with the same
+    tone (the Integrity Mirror). Both query texts are embedded in one request and
+    the two vector queries run concurrently. Results are deduplicated by id and
+    re-ranked together (see rerank), keeping n_results per query that ran; each
+    carries "source" ("semantic" or "pattern") and its blended "rank".
+    As in search_memories, semantic matches below min_relevance are dropped.
+    """
+    if not prompt or not username:
+        return []
+    with_patterns = bool(tone) and (weight or 0) >= pattern_min_weight
+    texts = [prompt, _pattern_probe(tone)] if with_patterns else [prompt]
+
+    try:
+        embeddings = _embed_many(texts, "retrieval_query")
+    except Exception as e:
+        print(f"Embedding error: {e}")
         return []
+
+    backend = get_vector_backend()
+    if not backend:
+        return []
+
+    queries = [("semantic", embeddings[0], None)]
+    if with_patterns:
+        queries.append(("pattern", embeddings[1], tone))
+    futures = [
+        (source, _query_pool.submit(_query_user, backend, username, vector, n_results * MEMORY_RERANK_OVERFETCH, tone=query_tone))
+        for source, vector, query_tone in queries
+        if vector
+    ]
+
+    merged = {}
+    sources = {}
+    for source, future in futures:
+        try:
+            matches = future.result()
+        except Exception as e:
+            print(f"Vector Search Error ({source}): {e}")
+            continue
+        for match in matches:
+            if source == "semantic" and match.score < min_relevance:
+                continue
+            seen = merged.get(match.id)
+            sources.setdefault(match.id, source)
+            if seen is None or match.score > seen.score:
+                merged[match.id] = match
+
+    return [
+        {
+            "id": match.id,
+            "content": match.metadata.get("text", ""),
+            "metadata": match.metadata,
+            "score": match.score,
+            "distance": 1 - match.score,
+            "rank": rank,
+            "source": sources[match.id],
+        }
+        for match, rank in rerank(list(merged.values()), n_results * len(futures))
+    ]
+
+def _cluster(vectors: np.ndarray, threshold: float, max_size: int) -> List[List[int]]:
+    """
+    Greedy single-pass clustering of unit vectors: each joins the most similar
+    cluster centroid at or above `threshold` (if it has room) or starts a new one.
+    """
+    clusters = []
+    centroids = np.empty((0, vectors.shape[1]), dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        if len(clusters):
+            scores = centroids @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= threshold and len(clusters[best]) < max_size:
+                clusters[best].append(i)
+                centroid = vectors[clusters[best]].mean(axis=0)
+                centroids[best] = centroid / (np.linalg.norm(centroid) or 1.0)
+                continue
+        clusters.append([i])
+        centroids = np.vstack([centroids, vector[None, :]])
+    return clusters
+
+def _summarize_cluster(tone: Optional[str], role: str, members: List[Dict[str, Any]]) -> str:
+    lines = [f"- ({m['timestamp'][:10]}) {m['text']}" for m in members]
+    speaker = "the user" if role == "user" else "Clara (the assistant)"
+    prompt = (
+        f"Below are {len(members)} related journal moments written by {speaker}"
+        + (f", all with the emotional tone '{tone}'" if tone else "")
+        + ".\n\n" + "\n".join(lines)
+        + "\n\nWrite one durable memory that captures what these moments have in common, "
+        "including how often and over what period they came up."
+    )
+    return (llm.get_summary_model().generate_content(prompt).text or "").strip()
+
+def consolidate_memories(
+    username: str,
+    older_than_days: int = MEMORY_CONSOLIDATE_AFTER_DAYS,
+    similarity: float = MEMORY_CONSOLIDATE_SIMILARITY,
+    min_cluster_size: int = 3,
+    max_cluster_size: int = 25,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    """
+    Fold a user's memories older than `older_than_days` into summary memories.
+    Memories are grouped by role and tone, clustered by embedding similarity, and
+    each cluster of at least `min_cluster_size` is summarised by the summary model
+    into one vector that keeps the tone (so tone-filtered Integrity Mirror queries
+    still find it), the highest weight, the date range and the number of moments
+    folded in. The consolidated vector is upserted (deterministic id, so re-runs
+    overwrite) before its originals are deleted. Consolidated memories aren't
+    consolidated again. Only the user's namespace is covered, not legacy vectors.
+    Returns counts: scanned, clusters, consolidated (originals folded), created.
+    """
+    stats = {"scanned": 0, "clusters": 0, "consolidated": 0, "created": 0}
+    backend = get_vector_backend()
+    if not username or not backend:
+        return stats
+    namespace = _namespace(username)
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=older_than_days)
+
+    groups = {}
+    for ids in backend.list_ids(namespace=namespace):
+        for memory_id, match in backend.fetch(ids, namespace=namespace).items():
+            stats["scanned"] += 1
+            metadata = match.metadata
+            ts = _parse_timestamp(metadata.get("timestamp"))
+            if metadata.get("consolidated") or ts is None or ts >= cutoff or not match.values:
+                continue
+            key = (metadata.get("role", "user"), metadata.get("tone"))
+            groups.setdefault(key, []).append({
+                "id": memory_id,
+                "values": match.values,
+                "text": metadata.get("text", ""),
+                "timestamp": ts.isoformat(),
+                "metadata": metadata,
+            })
+
+    for (role, tone), members in groups.items():
+        if len(members) < min_cluster_size:
+            continue
+        members.sort(key=lambda m: m["timestamp"])
+        vectors = np.asarray([m["values"] for m in members], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        for cluster in _cluster(vectors, similarity, max_cluster_size):
+            if len(cluster) < min_cluster_size:
+                continue
+            stats["clusters"] += 1
+            folded = [members[i] for i in cluster]
+            if dry_run:
+                stats["consolidated"] += len(folded)
+                continue
+            try:
+                summary = _summarize_cluster(tone, role, folded)
+                embedding = _embed(summary, "retrieval_document", title="Clara Memory") if summary else None
+            except Exception as e:
+                print(f"Consolidation summary error ({username}): {e}")
+                continue
+            if not embedding:
+                continue
+
+            weights = [m["metadata"].get("weight") for m in folded]
+            weights = [w for w in weights if isinstance(w, (int, float))]
+            digest = hashlib.sha256("|".join(sorted(m["id"] for m in folded)).encode("utf-8")).hexdigest()[:20]
+            metadata = {
+                "username": username,
+                "role": role,
+                "text": summary,
+                "timestamp": folded[-1]["timestamp"],
+                "firstDate": folded[0]["timestamp"],
+                "lastDate": folded[-1]["timestamp"],
+                "repeats": sum(int(m["metadata"].get("repeats", 1)) for m in folded),
+                "memoryCount": len(folded),
+                "consolidated": True,
+            }
+            if tone:
+                metadata["tone"] = tone
+            if weights:
+                metadata["weight"] = max(weights)
+            backend.upsert(
+                [{"id": f"{username}#consolidated-{digest}", "values": embedding, "metadata": metadata}],
+                namespace=namespace,
+            )
+            folded_ids = [m["id"] for m in folded]
+            for start in range(0, len(folded_ids), 1000):
+                backend.delete(folded_ids[start:start + 1000], namespace=namespace)
+            stats["created"] += 1
+            stats["consolidated"] += len(folded)
+    return stats
@@ -0,0 +1,126 @@
+import queue
+import threading
+import time
+
+class IngestQueue:
+    """
+    Bounded hand-off between the request path and background workers.
+    Records are picked up in micro-batches (up to `batch_size`, waiting at most
+    `linger` seconds for a batch to fill) and passed to `handler(records)`, which
+    returns the records it could not store (or raises, failing them all). Those
+    are retried with exponential backoff up to `max_attempts` times.
+
+    Backpressure: when the queue is full, submit() waits up to `put_timeout`
+    seconds for room and then runs the handler in the caller's thread, so a
+    stalled vector store slows producers down instead of dropping memories.
+    drain() (registered at interpreter exit by the owner) stops intake and waits
+    for queued work to finish.
+    """
+
+    def __init__(
+        self,
+        handler,
+        workers: int = 2,
+        max_pending: int = 1000,
+        batch_size: int = 32,
+        linger: float = 0.05,
+        max_attempts: int = 4,
+        put_timeout: float = 0.5,
+        name: str = "clara-ingest",
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_attempts = max_attempts
+        self.put_timeout = put_timeout
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._closed = False
+        self._counts = {"enqueued": 0, "stored": 0, "retried": 0, "failed": 0, "inline": 0}
+
+    def submit(self, records) -> None:
+        records = list(records)
+        if not records:
+            return
+        self._start()
+        for i, record in enumerate(records):
+            if self._closed:
+                self._run_inline(records[i:])
+                return
+            try:
+                self._queue.put(record, timeout=self.put_timeout)
+            except queue.Full:
+                self._run_inline(records[i:])
+                return
+            self._count("enqueued")
+
+    def _run_inline(self, records):
+        self._count("inline", len(records))
+        self._store(records)
+
+    def _start(self):
+        with self._lock:
+            if self._threads or self._closed:
+                return
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._store(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _store(self, records):
+        pending = records
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self._count("retried", len(pending))
+                time.sleep(min(2 ** (attempt - 1), 30))
+            try:
+                failed = self.handler(pending) or []
+            except Exception as e:
+                print(f"{self.name} batch error: {e}")
+                failed = pending
+            self._count("stored", len(pending) - len(failed))
+            pending = failed
+            if not pending:
+                return
+        self._count("failed", len(pending))
+        print(f"{self.name}: gave up on {len(pending)} records after {self.max_attempts} attempts")
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._counts[key] += n
+
+    def drain(self, timeout: float = 30.0) -> bool:
+        """Stop accepting new work and wait for queued records; False if time ran out."""
+        self._closed = True
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"{self.name}: {self._queue.unfinished_tasks} records still pending at shutdown")
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counts, "pending": self._queue.qsize(), "workers": len(self._threads)}
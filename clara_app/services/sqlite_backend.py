@@ -0,0 +1,397 @@
+import datetime
+import json
+import queue
+import uuid
+from contextlib import contextmanager
+
+try:
+    # Newer SQLite build shipped via requirements.txt on Linux hosts.
+    import pysqlite3 as sqlite3
+except ImportError:
+    import sqlite3
+
+from clara_app.services.storage_backend import StorageBackend, deep_merge, project_fields, resolve_server_timestamps, utc_now
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, doc_id)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    chat_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_chat_ts ON messages (chat_id, ts);
+CREATE TABLE IF NOT EXISTS message_archives (
+    chat_id TEXT NOT NULL,
+    archive_id TEXT NOT NULL,
+    start_ts REAL NOT NULL,
+    end_ts REAL NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (chat_id, archive_id)
+);
+CREATE INDEX IF NOT EXISTS idx_archives_chat_start ON message_archives (chat_id, start_ts);
+CREATE TABLE IF NOT EXISTS usage_daily (
+    chat_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL,
+    PRIMARY KEY (chat_id, date)
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    doc_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (doc_id, field)
+);
+"""
+
+# --- Timestamp / JSON helpers ---
+
+def _to_epoch(ts) -> float:
+    if isinstance(ts, datetime.datetime):
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=datetime.timezone.utc)
+        return ts.timestamp()
+    return float(ts)
+
+def _from_epoch(value: float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc)
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": _to_epoch(value)}
+    return str(value)
+
+def _json_object_hook(obj):
+    if set(obj) == {"__datetime__"}:
+        return _from_epoch(obj["__datetime__"])
+    return obj
+
+def _dumps(data: dict) -> str:
+    return json.dumps(data, default=_json_default)
+
+def _loads(text: str) -> dict:
+    return json.loads(text, object_hook=_json_object_hook)
+
+# --- Connection pool ---
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections shared across Streamlit script threads."""
+
+    def __init__(self, path: str, size: int = 4, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self._pool.put(self._connect())
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            isolation_level=None,  # explicit BEGIN/COMMIT below
+            uri=self.path.startswith("file:"),
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = self._pool.get(timeout=self.timeout)
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Yield a connection inside BEGIN IMMEDIATE ... COMMIT (rolled back on error)."""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+class SQLiteBackend(StorageBackend):
+    """
+    Single-node StorageBackend on SQLite (WAL mode, pooled connections).
+    Chats, users and beta keys are JSON documents in `docs`; messages, daily usage
+    and metrics get their own tables so counters and history queries stay indexed.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = "clara.db", pool_size: int = 4):
+        self.pool = ConnectionPool(path, size=pool_size)
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    # --- generic docs ---
+    @staticmethod
+    def _get_doc(conn, collection: str, doc_id: str):
+        row = conn.execute(
+            "SELECT data FROM docs WHERE collection = ? AND doc_id = ?", (collection, doc_id)
+        ).fetchone()
+        return _loads(row[0]) if row else None
+
+    def _merge_doc(self, conn, collection: str, doc_id: str, fields: dict):
+        existing = self._get_doc(conn, collection, doc_id) or {}
+        merged = deep_merge(existing, resolve_server_timestamps(fields))
+        conn.execute(
+            "INSERT INTO docs (collection, doc_id, data) VALUES (?, ?, ?) "
+            "ON CONFLICT (collection, doc_id) DO UPDATE SET data = excluded.data",
+            (collection, doc_id, _dumps(merged)),
+        )
+
+    def _read_doc(self, collection: str, doc_id: str):
+        with self.pool.connection() as conn:
+            return self._get_doc(conn, collection, doc_id)
+
+    def _write_doc(self, collection: str, doc_id: str, fields: dict):
+        with self.pool.transaction() as conn:
+            self._merge_doc(conn, collection, doc_id, fields)
+
+    def _delete_doc(self, collection: str, doc_id: str) -> int:
+        with self.pool.transaction() as conn:
+            return conn.execute("DELETE FROM docs WHERE collection = ? AND doc_id = ?", (collection, doc_id)).rowcount
+
+    # --- chats ---
+    def get_chat(self, chat_id, fields=None):
+        data = self._read_doc("chats", chat_id)
+        return project_fields(data, fields) if data is not None else None
+
+    def merge_chat(self, chat_id, fields):
+        self._write_doc("chats", chat_id, fields)
+
+    def delete_chat(self, chat_id, on_deleted=None):
+        with self.pool.transaction() as conn:
+            deleted = conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,)).rowcount
+            deleted += conn.execute("DELETE FROM message_archives WHERE chat_id = ?", (chat_id,)).rowcount
+            deleted += conn.execute("DELETE FROM docs WHERE collection = 'chats' AND doc_id = ?", (chat_id,)).rowcount
+        if on_deleted is not None:
+            on_deleted(deleted)
+
+    # --- messages ---
+    @staticmethod
+    def _insert_message(conn, chat_id, message):
+        conn.execute(
+            # A message with a client-chosen id that already exists is a retry: keep the first.
+            "INSERT INTO messages (id, chat_id, role, content, ts) VALUES (?, ?, ?, ?, ?) ON CONFLICT (id) DO NOTHING",
+            (
+                message.get("id") or uuid.uuid4().hex,
+                chat_id,
+                message["role"],
+                message["content"],
+                _to_epoch(message.get("ts") or utc_now()),
+            ),
+        )
+
+    def add_message(self, chat_id, message):
+        with self.pool.transaction() as conn:
+            self._insert_message(conn, chat_id, message)
+
+    def list_messages(self, chat_id, *, after_ts=None, before=None, limit=60):
+        sql = "SELECT id, role, content, ts FROM messages WHERE chat_id = ?"
+        params = [chat_id]
+        if after_ts:
+            sql += " AND ts > ?"
+            params.append(_to_epoch(after_ts))
+        if before is not None:
+            before_ts, before_id = before
+            sql += " AND (ts < ? OR (ts = ? AND id < ?))"
+            params += [_to_epoch(before_ts), _to_epoch(before_ts), before_id]
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+        params.append(int(limit))
+        with self.pool.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [{"id": r[0], "role": r[1], "content": r[2], "ts": _from_epoch(r[3])} for r in rows]
+
+    def iter_messages(self, chat_id, page_size=500):
+        # Keyset pagination on (ts, id), so no pooled connection is held between pages.
+        last = None
+        while True:
+            sql = "SELECT id, role, content, ts FROM messages WHERE chat_id = ?"
+            params = [chat_id]
+            if last is not None:
+                sql += " AND (ts > ? OR (ts = ? AND id > ?))"
+                params += [last[1], last[1], last[0]]
+            sql += " ORDER BY ts, id LIMIT ?"
+            params.append(int(page_size))
+            with self.pool.connection() as conn:
+                rows = conn.execute(sql, params).fetchall()
+            for r in rows:
+                yield {"id": r[0], "role": r[1], "content": r[2], "ts": _from_epoch(r[3])}
+            if len(rows) < page_size:
+                return
+            last = (rows[-1][0], rows[-1][3])
+
+    def iter_chat_ids(self):
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT doc_id FROM docs WHERE collection = 'chats' UNION SELECT DISTINCT chat_id FROM messages"
+            ).fetchall()
+        for (chat_id,) in rows:
+            yield chat_id
+
+    # --- message archives ---
+    def list_archives(self, chat_id, *, until_ts=None, limit=2):
+        sql = "SELECT archive_id, data FROM message_archives WHERE chat_id = ?"
+        params = [chat_id]
+        if until_ts is not None:
+            sql += " AND start_ts <= ?"
+            params.append(_to_epoch(until_ts))
+        sql += " ORDER BY start_ts DESC LIMIT ?"
+        params.append(int(limit))
+        with self.pool.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [dict(_loads(data), id=archive_id) for archive_id, data in rows]
+
+    def iter_archives(self, chat_id):
+        with self.pool.connection() as conn:
+            ids = [r[0] for r in conn.execute(
+                "SELECT archive_id FROM message_archives WHERE chat_id = ? ORDER BY start_ts", (chat_id,)
+            ).fetchall()]
+        # One archive in memory at a time.
+        for archive_id in ids:
+            with self.pool.connection() as conn:
+                row = conn.execute(
+                    "SELECT data FROM message_archives WHERE chat_id = ? AND archive_id = ?", (chat_id, archive_id)
+                ).fetchone()
+            if row:
+                yield dict(_loads(row[0]), id=archive_id)
+
+    def write_archive(self, chat_id, archive):
+        data = {k: v for k, v in archive.items() if k != "id"}
+        with self.pool.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO message_archives (chat_id, archive_id, start_ts, end_ts, data) VALUES (?, ?, ?, ?, ?)",
+                (chat_id, archive["id"], _to_epoch(archive["startTs"]), _to_epoch(archive["endTs"]), _dumps(data)),
+            )
+            conn.executemany(
+                "DELETE FROM messages WHERE chat_id = ? AND id = ?",
+                [(chat_id, m["id"]) for m in archive["messages"]],
+            )
+
+    # --- usage ---
+    def get_daily_count(self, chat_id, date_str):
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT count FROM usage_daily WHERE chat_id = ? AND date = ?", (chat_id, date_str)
+            ).fetchone()
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def _increment_daily(conn, chat_id, date_str, amount):
+        conn.execute(
+            "INSERT INTO usage_daily (chat_id, date, count, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (chat_id, date) DO UPDATE SET count = count + excluded.count, updated_at = excluded.updated_at",
+            (chat_id, date_str, int(amount), _to_epoch(utc_now())),
+        )
+
+    def increment_daily_count(self, chat_id, date_str, amount=1):
+        with self.pool.transaction() as conn:
+            self._increment_daily(conn, chat_id, date_str, amount)
+
+    def consume_daily_quota(self, chat_id, date_str, amount=1, limit=None):
+        with self.pool.transaction() as conn:
+            row = conn.execute(
+                "SELECT count FROM usage_daily WHERE chat_id = ? AND date = ?", (chat_id, date_str)
+            ).fetchone()
+            count = int(row[0]) if row else 0
+            if limit is not None and count + amount > limit:
+                return False, count
+            self._increment_daily(conn, chat_id, date_str, amount)
+            return True, count + int(amount)
+
+    def iter_daily_usage(self, chat_id):
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT date, count, updated_at FROM usage_daily WHERE chat_id = ? ORDER BY date", (chat_id,)
+            ).fetchall()
+        for date, count, updated_at in rows:
+            yield date, {"count": count, "updatedAt": _from_epoch(updated_at) if updated_at is not None else None}
+
+    def delete_usage(self, chat_id, on_deleted=None):
+        with self.pool.transaction() as conn:
+            deleted = conn.execute("DELETE FROM usage_daily WHERE chat_id = ?", (chat_id,)).rowcount
+            deleted += conn.execute("DELETE FROM docs WHERE collection = 'usage' AND doc_id = ?", (chat_id,)).rowcount
+        if on_deleted is not None:
+            on_deleted(deleted)
+
+    # --- users ---
+    def get_user(self, user_id):
+        return self._read_doc("users", user_id)
+
+    def merge_user(self, user_id, fields):
+        self._write_doc("users", user_id, fields)
+
+    def delete_user(self, user_id, on_deleted=None):
+        deleted = self._delete_doc("users", user_id)
+        if on_deleted is not None:
+            on_deleted(deleted)
+
+    # --- beta keys ---
+    def get_beta_key(self, code):
+        return self._read_doc("beta_keys", code)
+
+    def merge_beta_key(self, code, fields):
+        self._write_doc("beta_keys", code, fields)
+
+    # --- metrics ---
+    @staticmethod
+    def _increment_metric(conn, doc_id, field, amount):
+        conn.execute(
+            "INSERT INTO metrics (doc_id, field, count) VALUES (?, ?, ?) "
+            "ON CONFLICT (doc_id, field) DO UPDATE SET count = count + excluded.count",
+            (doc_id, field, int(amount)),
+        )
+
+    def increment_metric(self, doc_id, field, amount=1):
+        with self.pool.transaction() as conn:
+            self._increment_metric(conn, doc_id, field, amount)
+
+    def increment_metrics(self, doc_id, counts):
+        with self.pool.transaction() as conn:
+            for field, amount in counts.items():
+                self._increment_metric(conn, doc_id, field, amount)
+
+    def get_metrics(self, doc_id):
+        with self.pool.connection() as conn:
+            rows = conn.execute("SELECT field, count FROM metrics WHERE doc_id = ?", (doc_id,)).fetchall()
+        return {field: count for field, count in rows}
+
+    # --- batching ---
+    def apply_writes(self, ops):
+        """Apply all buffered writes in a single transaction."""
+        with self.pool.transaction() as conn:
+            for method, args in ops:
+                if method == "add_message":
+                    self._insert_message(conn, *args)
+                elif method == "increment_daily_count":
+                    self._increment_daily(conn, *args)
+                elif method == "increment_metric":
+                    self._increment_metric(conn, *args)
+                elif method == "increment_metrics":
+                    doc_id, counts = args
+                    for field, amount in counts.items():
+                        self._increment_metric(conn, doc_id, field, amount)
+                elif method == "merge_chat":
+                    self._merge_doc(conn, "chats", *args)
+                else:
+                    raise ValueError(f"Unsupported buffered write: {method}")
@@ -1,29 +1,146 @@
 import streamlit as st
 import firebase_admin
 from firebase_admin import credentials, firestore
+import atexit
 import datetime
-from clara_app.constants import FREE_DAILY_MESSAGE_LIMIT, PLUS_DAILY_MESSAGE_LIMIT, FORCE_PLAN, FIREBASE_SERVICE_ACCOUNT, FIREBASE_CREDENTIALS_PATH
+import hashlib
+import json
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from clara_app.constants import FREE_DAILY_MESSAGE_LIMIT, PLUS_DAILY_MESSAGE_LIMIT, FORCE_PLAN, FIREBASE_SERVICE_ACCOUNT, FIREBASE_CREDENTIALS_PATH, CHAT_DOC_CACHE_TTL_SECONDS, HISTORY_PAGE_SIZE, STORAGE_BACKEND, SQLITE_DB_PATH, METRIC_SHARD_COUNT, METRICS_FLUSH_INTERVAL_SECONDS, LEGACY_MIGRATION_ON_READ, FIRESTORE_PROBE_INTERVAL_SECONDS, FIRESTORE_CALL_TIMEOUT_SECONDS, ARCHIVE_AFTER_DAYS, ARCHIVE_CHUNK_SIZE, ARCHIVE_MAX_BYTES
+from clara_app.services.firestore_backend import MAX_BATCH_WRITES, FirestoreBackend
+from clara_app.services.firestore_client import FirestoreClientManager
+from clara_app.services.storage_backend import SERVER_TIMESTAMP, ReadMeter, StorageUnavailable, WriteOutcomeUnknown, approx_doc_bytes
 from clara_app.utils.helpers import normalize_email
 
-# @st.cache_resource # Removed to prevent stale client issues after long uptime
-def get_db():
-    if not firebase_admin._apps:
+def _init_firebase_app():
+    if FIREBASE_SERVICE_ACCOUNT:
+        cred = credentials.Certificate(dict(FIREBASE_SERVICE_ACCOUNT))
+    else:
+        cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
+    firebase_admin.initialize_app(cred)
 
-        try:
-            if FIREBASE_SERVICE_ACCOUNT:
-                cred = credentials.Certificate(dict(FIREBASE_SERVICE_ACCOUNT))
-            else:
-                cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
-            firebase_admin.initialize_app(cred)
-        except Exception as e:
-            print(f"Error loading Firebase: {e}")
-            return None
+def _record_client_rotation():
+    _increment_metric("firestore_client", "rotations")
 
+# One health-checked client per process instead of @st.cache_resource, which
+# served the same client forever even after its channel had gone stale.
+_client_manager = FirestoreClientManager(
+    _init_firebase_app,
+    probe_interval=FIRESTORE_PROBE_INTERVAL_SECONDS,
+    call_timeout=FIRESTORE_CALL_TIMEOUT_SECONDS,
+    on_rotate=_record_client_rotation,
+)
+
+def get_db():
+    """The shared Firestore client, or None if Firebase can't be initialised."""
     try:
-        return firestore.client()
-    except Exception:
+        return _client_manager.client()
+    except Exception as e:
+        print(f"Error loading Firebase: {e}")
         return None
 
+def get_client_stats() -> dict:
+    """Rotation / health-probe counters for the shared Firestore client."""
+    return _client_manager.stats()
+
+# --- Backend selection ---
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """
+    Return the process-wide StorageBackend chosen by CLARA_STORAGE_BACKEND
+    ("firestore" by default, or "sqlite" for single-node / local runs).
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if STORAGE_BACKEND == "sqlite":
+                    from clara_app.services.sqlite_backend import SQLiteBackend
+                    _backend = SQLiteBackend(SQLITE_DB_PATH)
+                else:
+                    _backend = FirestoreBackend(
+                        get_db,
+                        metric_shards=METRIC_SHARD_COUNT,
+                        call_options=_client_manager.call_options,
+                    )
+    return _backend
+
+def uses_firestore() -> bool:
+    return get_backend().name == "firestore"
+
+# --- Turn-scoped write buffer ---
+
+class TurnWriteBuffer:
+    """
+    Collects the fire-and-forget writes of one chat turn (messages, usage counter,
+    topic metrics) and commits them in one backend batch (a Firestore WriteBatch,
+    or a single SQLite transaction) instead of one round trip per write.
+    """
+
+    def __init__(self, background: bool = False):
+        self.background = background
+        self._ops = []
+
+    def add(self, method: str, *args):
+        self._ops.append((method, args))
+
+    def __len__(self):
+        return len(self._ops)
+
+    def flush(self):
+        """Commit everything buffered so far. Never raises."""
+        ops, self._ops = self._ops, []
+        if not ops:
+            return
+        if self.background:
+            threading.Thread(target=_commit_writes, args=(ops,), daemon=True).start()
+        else:
+            _commit_writes(ops)
+
+def _commit_writes(ops):
+    try:
+        get_backend().apply_writes(ops)
+    except Exception as e:
+        print(f"Error committing turn writes: {e}")
+
+_turn_state = threading.local()
+
+@contextmanager
+def turn_writes(background: bool = False):
+    """
+    Buffer this thread's storage writes until the block exits.
+    The buffer is flushed on normal exit and on any exception (including
+    Streamlit's rerun/stop control flow), so a failed turn still persists
+    whatever it managed to record.
+    """
+    outer = getattr(_turn_state, "buffer", None)
+    if outer is not None:
+        # Nested turn: join the outer buffer, it owns the flush.
+        yield outer
+        return
+    buffer = TurnWriteBuffer(background=background)
+    _turn_state.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        _turn_state.buffer = None
+        buffer.flush()
+
+def _buffered(method: str, *args):
+    """Run a backend write now, or defer it to the active turn buffer if there is one."""
+    buffer = getattr(_turn_state, "buffer", None)
+    if buffer is not None:
+        buffer.add(method, *args)
+    else:
+        getattr(get_backend(), method)(*args)
+
 # --- Access Key Management ---
 
 def validate_access_code(code: str) -> dict:
@@ -52,15 +169,10 @@ def validate_access_code(code: str) -> dict:
         res["master"] = True
         return res
     
-    db = get_db()
-    if db is None:
-        return res
-        
     try:
-        doc = db.collection("beta_keys").document(code).get()
-        if doc.exists:
+        data = get_backend().get_beta_key(code)
+        if data is not None:
             res["valid"] = True
-            data = doc.to_dict() or {}
             res["used"] = data.get("used", False)
     except Exception:
         pass
@@ -75,24 +187,24 @@ def claim_access_code(code: str, user_id: str):
     if not code or code == BETA_ACCESS_KEY or code == DEVELOPER_KEY:
         return
         
-    db = get_db()
-    if db is None:
-        return
-        
     try:
-        db.collection("beta_keys").document(code).set({
+        get_backend().merge_beta_key(code, {
             "used": True,
             "usedBy": user_id,
-            "usedAt": firestore.SERVER_TIMESTAMP
-        }, merge=True)
+            "usedAt": SERVER_TIMESTAMP
+        })
     except Exception:
         pass
 
 # initialize_firebase is deprecated in favor of cached get_db, but kept for compatibility if needed elsewhere
 def initialize_firebase():
+    if not uses_firestore():
+        return None
     return get_db()
 
 def is_initialized():
+    if not uses_firestore():
+        return True, get_backend().name
     try:
         app = firebase_admin.get_app()
         return True, app.name
@@ -102,47 +214,122 @@ def is_initialized():
 # --- DB Helpers ---
 
 def _get_chat_doc(username):
+    """Firestore ref for chats/{username}; only used by the Firestore-specific legacy migrations."""
+    if not uses_firestore():
+        return None
     db = get_db()
     if db is None:
         return None
     return db.collection("chats").document(username)
 
-def _get_user_doc(user_id: str):
-    db = get_db()
-    if db is None:
-        return None
-    return db.collection("users").document(user_id)
+# The only chat-doc fields the profile/plan/summary/history getters read. Projecting
+# to these keeps an unmigrated user's legacy `messages` array off every small read.
+CHAT_PROFILE_FIELDS = ["profile", "usage", "summary", "clearedAt", "archive"]
+
+# Approximate bytes returned per chat-doc read, by call site (see read_meter.stats()).
+read_meter = ReadMeter()
+
+class ChatDocSnapshot:
+    """
+    Short-lived, process-wide cache of `chats/{username}` documents.
+    A single rerun of the chat view reads the name, plan, summary, profile note,
+    timezone and clearedAt from the same doc; the snapshot fetches it once and
+    serves every getter from memory until the TTL expires or a write invalidates it.
+    Only CHAT_PROFILE_FIELDS are fetched; legacy history is read separately.
+    """
+
+    def __init__(self, ttl_seconds: float = CHAT_DOC_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        """
+        Return the chat doc as a dict, or None if it is missing. Raises
+        StorageUnavailable if it couldn't be read, so callers don't mistake a
+        failed read for a user with no profile.
+        """
+        if not username:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and now - entry[0] < self.ttl_seconds:
+                return entry[1]
+
+        try:
+            data = get_backend().get_chat(username, fields=CHAT_PROFILE_FIELDS)
+        except Exception as e:
+            # Don't cache failures; the next call retries.
+            raise StorageUnavailable(f"Could not read chat doc: {e}") from e
+        read_meter.record("chat_profile", data)
+
+        with self._lock:
+            self._entries[username] = (now, data)
+        return data
+
+    def peek(self, username):
+        """(True, data) if a fresh snapshot is held for username, else (False, None). Never reads."""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                return True, entry[1]
+        return False, None
+
+    def put(self, username, data):
+        """Seed the snapshot with a doc that was fetched elsewhere (e.g. the async loader)."""
+        if not username:
+            return
+        with self._lock:
+            self._entries[username] = (time.monotonic(), data)
+
+    def invalidate(self, username=None):
+        """Drop one user's snapshot, or every snapshot if no username is given."""
+        with self._lock:
+            if username is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(username, None)
+
+_chat_snapshots = ChatDocSnapshot()
+
+def _get_chat_data(username):
+    return _chat_snapshots.get(username)
+
+def invalidate_chat_snapshot(username=None):
+    _chat_snapshots.invalidate(username)
 
 def ensure_user_identity(user_id: str, email: str):
     """
     Keep a stable user document keyed by user_id, storing the login email separately.
     """
-    doc_ref = _get_user_doc(user_id)
-    if doc_ref is None:
+    if not user_id:
         return
     try:
-        existing = doc_ref.get()
+        backend = get_backend()
+        existing = backend.get_user(user_id)
         payload = {
             "email": normalize_email(email),
             "updatedAt": datetime.datetime.now(datetime.timezone.utc),
         }
-        if not existing.exists:
-            payload["createdAt"] = firestore.SERVER_TIMESTAMP
-        doc_ref.set(payload, merge=True)
+        if existing is None:
+            payload["createdAt"] = SERVER_TIMESTAMP
+        backend.merge_user(user_id, payload)
     except Exception:
         pass
 
 def chat_doc_exists(chat_id: str) -> bool:
-    doc_ref = _get_chat_doc(chat_id)
-    if doc_ref is None:
+    if not chat_id:
         return False
     try:
-        doc = doc_ref.get()
-        return bool(doc.exists)
+        # Empty field mask: existence check without downloading any fields.
+        return get_backend().get_chat(chat_id, fields=[]) is not None
     except Exception:
         return False
 
 def _daily_usage_doc(username, date_str: str):
+    if not uses_firestore():
+        return None
     db = get_db()
     if db is None:
         return None
@@ -151,8 +338,10 @@ def _daily_usage_doc(username, date_str: str):
 def migrate_legacy_chat_doc(*, legacy_chat_id: str, new_chat_id: str, email: str, max_messages: int = 250) -> bool:
     """
     Best-effort migration from legacy chat doc ids (email) to stable ids (hash).
-    Copies core fields and a bounded number of recent messages.
+    Copies core fields and a bounded number of recent messages. Firestore only.
     """
+    if not uses_firestore():
+        return False
     db = get_db()
     if db is None:
         return False
@@ -234,6 +423,8 @@ def migrate_legacy_chat_doc(*, legacy_chat_id: str, new_chat_id: str, email: str
 
         # Leave legacy chat doc intact, but mark it for diagnostics.
         legacy_ref.set({"chatMeta": {"migratedTo": new_chat_id}}, merge=True)
+        invalidate_chat_snapshot(legacy_chat_id)
+        invalidate_chat_snapshot(new_chat_id)
 
         # Best-effort: carry over today's usage counter so limits behave consistently.
         try:
@@ -252,40 +443,36 @@ def migrate_legacy_chat_doc(*, legacy_chat_id: str, new_chat_id: str, email: str
         return False
 
 def get_cleared_at(username):
-    doc_ref = _get_chat_doc(username)
-    if doc_ref is None:
-        return None
-    try:
-        doc = doc_ref.get()
-        if not doc.exists:
-            return None
-        return (doc.to_dict() or {}).get("clearedAt")
-    except Exception:
+    data = _get_chat_data(username)
+    if data is None:
         return None
+    return data.get("clearedAt")
 
-def append_chat_message(username, role: str, content: str):
-    """Append a single message to Firestore as its own document."""
-    db = get_db()
-    if db is None:
-        return
+def message_id(chat_id: str, turn_seq, role: str) -> str:
+    """Deterministic doc id for one side of a turn, so a repeated write lands on the same doc."""
+    return hashlib.sha256(f"{chat_id}:{turn_seq}:{role}".encode("utf-8")).hexdigest()[:24]
+
+def append_chat_message(username, role: str, content: str, turn_seq=None):
+    """
+    Append a single message to the chat as its own document.
+    With a turn_seq (unique per turn for this chat) the doc id is derived from
+    (chat, turn_seq, role) and written with create semantics, so retries and
+    reruns can't store the same message twice.
+    """
     if not username or role not in ("user", "assistant"):
         return
     if not isinstance(content, str) or not content.strip():
         return
 
-    doc_ref = _get_chat_doc(username)
-    if doc_ref is None:
-        return
-
+    message = {
+        "role": role,
+        "content": content,
+        "ts": datetime.datetime.now(datetime.timezone.utc),
+    }
+    if turn_seq is not None:
+        message["id"] = message_id(username, turn_seq, role)
     try:
-        msg_ref = doc_ref.collection("messages").document()
-        msg_ref.set(
-            {
-                "role": role,
-                "content": content,
-                "ts": datetime.datetime.now(datetime.timezone.utc),
-            }
-        )
+        _buffered("add_message", username, message)
     except Exception:
         # Persistence should never break the main chat flow
         pass
@@ -295,28 +482,30 @@ def clear_chat_history(username):
     "Clear memory" without deleting docs: mark a cutoff timestamp and clear the durable summary.
     Message queries only return items newer than clearedAt.
     """
-    doc_ref = _get_chat_doc(username)
-    if doc_ref is None:
+    if not username:
         return
     try:
         now = datetime.datetime.now(datetime.timezone.utc)
-        doc_ref.set(
+        get_backend().merge_chat(
+            username,
             {
                 "clearedAt": now,
                 "summary": "",
                 # Keep legacy field small if it exists from earlier versions
                 "messages": [],
             },
-            merge=True,
         )
     except Exception:
         pass
+    invalidate_chat_snapshot(username)
 
 def _maybe_migrate_legacy_messages(username, legacy_messages):
     """
     One-time migration: if there are no message docs yet, copy the legacy `messages` array
     into `chats/{username}/messages/*` so we can stop rewriting a single large document.
     """
+    if not uses_firestore():
+        return
     db = get_db()
     if db is None:
         return
@@ -356,68 +545,250 @@ def _maybe_migrate_legacy_messages(username, legacy_messages):
         doc_ref.set({"messages": [], "chatMeta": {"legacyMigrated": True}}, merge=True)
     except Exception:
         pass
+    invalidate_chat_snapshot(username)
 
-def get_chat_history(username, limit: int = 60):
+def get_chat_history(username, limit: int = HISTORY_PAGE_SIZE):
     """Load recent conversation from Firestore (subcollection-first, legacy fallback)."""
-    db = get_db()
-    if db is None:
-        return []
-    if not username:
-        return []
+    items, _ = get_chat_history_page(username, page_size=limit)
+    return items
 
-    doc_ref = _get_chat_doc(username)
-    if doc_ref is None:
-        return []
+def get_chat_history_page(username, before=None, page_size: int = HISTORY_PAGE_SIZE):
+    """
+    Load one page of conversation, newest page first.
+    Returns (messages oldest-first, cursor). Pass the cursor back as `before`
+    to fetch the next older page; it is None once there is nothing older.
+    """
+    if not username:
+        return [], None
 
-    cleared_at = get_cleared_at(username)
     try:
-        q = doc_ref.collection("messages")
-        if cleared_at:
-            q = q.where("ts", ">", cleared_at)
-        docs = q.order_by("ts", direction=firestore.Query.DESCENDING).limit(limit).get()
+        cleared_at = get_cleared_at(username)
+        # One row past the page tells whether an older page exists.
+        docs = get_backend().list_messages(username, after_ts=cleared_at, before=before, limit=page_size + 1)
+        docs = _with_archived(username, docs, page_size + 1, cleared_at, before)
         if docs:
-            items = []
-            for d in reversed(docs):
-                data = d.to_dict() or {}
-                role = data.get("role")
-                content = data.get("content")
-                if role in ("user", "assistant") and isinstance(content, str):
-                    items.append({"role": role, "content": content})
-            return items
+            docs, cursor = _split_page(docs, page_size)
+            return _messages_from_docs(reversed(docs)), cursor
+        if before is not None:
+            return [], None
     except Exception as e:
         # If query fails, fall back to legacy field
         print(f"Error fetching chat history (Query): {e}")
-        pass
+        if before is not None:
+            return [], None
+
+    # Legacy fallback: read `messages` array from the chat doc (older versions).
+    # The legacy array has no timestamps, so it is served as a single page.
+    return _legacy_history(username, page_size), None
+
+def _has_archives(username) -> bool:
+    return bool(((_get_chat_data(username) or {}).get("archive") or {}).get("hasChunks"))
+
+def _message_key(message):
+    """Position of a message in history order: (ts, id), the key history pages are cut on."""
+    return message.get("ts"), message.get("id") or ""
+
+def _with_archived(username, docs, page_size: int, cleared_at=None, before=None):
+    """
+    Top up a short page of live messages (newest first) from archive chunks, which
+    hold everything older than the live tail. Messages at or before clearedAt stay hidden.
+    """
+    if len(docs) >= page_size or not _has_archives(username):
+        return docs
+    docs = list(docs)
+    key_bound = _message_key(docs[-1]) if docs else before
+    bound = key_bound[0] if key_bound else None
+    backend = get_backend()
+    seen = set()
+    while len(docs) < page_size:
+        # Inclusive bound: an archive starting at the bound's ts can still hold
+        # messages that sort before it on id. Archives already read are skipped.
+        archives = [a for a in backend.list_archives(username, until_ts=bound, limit=2) if a["id"] not in seen]
+        if not archives:
+            break
+        for archive in archives:
+            seen.add(archive["id"])
+            for message in reversed(archive.get("messages") or []):
+                ts = message.get("ts")
+                if ts is None or (key_bound is not None and _message_key(message) >= key_bound):
+                    continue
+                if cleared_at and ts <= cleared_at:
+                    # Everything from here on is older still.
+                    return docs
+                docs.append(message)
+                if len(docs) >= page_size:
+                    return docs
+            bound = archive["startTs"]
+    return docs
 
-    # Legacy fallback: read `messages` array from the chat doc (older versions)
+# An archive is written in one batch with a delete per message, so it holds at most this many.
+MAX_ARCHIVE_CHUNK_SIZE = MAX_BATCH_WRITES - 1
+
+def compact_chat_messages(username, older_than_days: int = ARCHIVE_AFTER_DAYS, chunk_size: int = ARCHIVE_CHUNK_SIZE) -> int:
+    """
+    Roll live messages older than `older_than_days` into archive docs of up to
+    `chunk_size` messages (or ARCHIVE_MAX_BYTES). Each archive is written in the
+    same batch that deletes its messages, so an interrupted run loses or repeats
+    nothing. Only full chunks are written; the remainder stays live until the next
+    run. chunk_size is clamped to 1..MAX_ARCHIVE_CHUNK_SIZE. Returns the number
+    of messages archived.
+    """
+    if not username:
+        return 0
+    chunk_size = max(1, min(int(chunk_size), MAX_ARCHIVE_CHUNK_SIZE))
+    backend = get_backend()
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=older_than_days)
+    chunks = []
+    chunk, size = [], 0
+    for message in backend.iter_messages(username):
+        ts = message.get("ts")
+        if ts is None or ts >= cutoff:
+            break
+        chunk.append({k: message.get(k) for k in ("id", "role", "content", "ts")})
+        size += approx_doc_bytes(chunk[-1])
+        if len(chunk) >= chunk_size or size >= ARCHIVE_MAX_BYTES:
+            chunks.append(chunk)
+            chunk, size = [], 0
+    if not chunks:
+        return 0
+
+    # Flag the chat first so readers start consulting archives before any message moves.
+    _save_chat_fields(username, {"archive": {"hasChunks": True}})
+    archived = 0
+    for chunk in chunks:
+        start_ts, end_ts = chunk[0]["ts"], chunk[-1]["ts"]
+        backend.write_archive(
+            username,
+            {
+                "id": f"{int(start_ts.timestamp() * 1000):013d}-{chunk[0]['id']}",
+                "startTs": start_ts,
+                "endTs": end_ts,
+                "count": len(chunk),
+                "messages": chunk,
+            },
+        )
+        archived += len(chunk)
+        _save_chat_fields(username, {"archive": {"through": end_ts}})
+    return archived
+
+def _split_page(docs_newest_first, page_size: int):
+    """
+    Cut up to page_size + 1 docs (newest first) into (page, cursor). The cursor is
+    the (ts, id) key of the page's oldest message, or None if nothing older was fetched.
+    """
+    if len(docs_newest_first) <= page_size:
+        return docs_newest_first, None
+    page = docs_newest_first[:page_size]
+    return page, _message_key(page[-1])
+
+def _messages_from_docs(docs):
+    """
+    Convert stored message dicts (oldest first) into the session-state message format,
+    dropping repeated ids (the same doc served from both an archive and the live page).
+    """
+    items = []
+    seen_ids = set()
+    for data in docs:
+        role = data.get("role")
+        content = data.get("content")
+        if role not in ("user", "assistant") or not isinstance(content, str):
+            continue
+        doc_id = data.get("id")
+        if doc_id:
+            if doc_id in seen_ids:
+                continue
+            seen_ids.add(doc_id)
+        items.append({"role": role, "content": content})
+    return items
+
+def _legacy_history(username, limit: int):
+    """Serve history from the legacy `messages` array on the chat doc, migrating it on the way."""
+    if not LEGACY_MIGRATION_ON_READ:
+        # The batch migration has run, so there is no legacy array left to read.
+        return []
     try:
-        doc = doc_ref.get()
-        if not doc.exists:
+        # The only read that still downloads the legacy array, and only when the
+        # messages subcollection came back empty.
+        chat_data = get_backend().get_chat(username, fields=["messages", "clearedAt"])
+        read_meter.record("chat_legacy_messages", chat_data)
+        if chat_data is None:
             return []
-        legacy = (doc.to_dict() or {}).get("messages", []) or []
+        legacy = chat_data.get("messages", []) or []
         if isinstance(legacy, list) and legacy:
             _maybe_migrate_legacy_messages(username, legacy)
             # Apply clearedAt cutoff locally for legacy messages (no ts field there)
-            if cleared_at:
+            if chat_data.get("clearedAt"):
                 return []
             return legacy[-limit:]
     except Exception:
         pass
-
     return []
 
+class MetricAccumulator:
+    """
+    In-process tally of metric increments. Every `interval` seconds a daemon thread
+    flushes one merged increment per metrics doc, so a busy process sends a handful
+    of counter writes instead of one per message. Unflushed counts are re-queued when
+    a flush fails without writing (not when its outcome is unknown, which could
+    count them twice) and flushed at interpreter exit.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, doc_id: str, field: str, amount: int = 1):
+        with self._lock:
+            fields = self._counts.setdefault(doc_id, {})
+            fields[field] = fields.get(field, 0) + int(amount)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="clara-metrics-flush", daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._counts = self._counts, {}
+        if not pending:
+            return
+        try:
+            get_backend().apply_writes([("increment_metrics", (doc_id, fields)) for doc_id, fields in pending.items()])
+        except WriteOutcomeUnknown as e:
+            # The increments may already be counted; re-queueing them could count them twice.
+            print(f"Metrics flush outcome unknown, not retrying: {e}")
+        except Exception as e:
+            print(f"Error flushing metrics: {e}")
+            with self._lock:
+                for doc_id, fields in pending.items():
+                    target = self._counts.setdefault(doc_id, {})
+                    for field, amount in fields.items():
+                        target[field] = target.get(field, 0) + amount
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+_metric_accumulator = MetricAccumulator(METRICS_FLUSH_INTERVAL_SECONDS) if METRICS_FLUSH_INTERVAL_SECONDS > 0 else None
+if _metric_accumulator is not None:
+    atexit.register(_metric_accumulator.flush)
+
+def _increment_metric(doc_id: str, field: str):
+    if _metric_accumulator is not None:
+        _metric_accumulator.add(doc_id, field)
+    else:
+        _buffered("increment_metric", doc_id, field, 1)
+
 def log_topic_metric(topic: str):
     """
     Increment an anonymous aggregate counter for the given topic.
     No user identifiers or raw message text are stored in this document.
     """
-    db = get_db()
-    if db is None: return
     if not topic:
         topic = "other"
     try:
-        metrics_ref = db.collection("metrics").document("topics")
-        metrics_ref.set({topic: firestore.Increment(1)}, merge=True)
+        _increment_metric("topics", topic)
     except Exception:
         pass
 
@@ -426,89 +797,98 @@ def log_ml_topic_metric(topic: str):
     Increment an anonymous aggregate counter for the ML-based topic labels.
     Uses a separate document so it doesn't conflict with the heuristic logger.
     """
-    db = get_db()
-    if db is None:
-        return
     if not topic:
         topic = "Other"
     try:
-        metrics_ref = db.collection("metrics").document("topics_ml")
-        metrics_ref.set({topic: firestore.Increment(1)}, merge=True)
+        _increment_metric("topics_ml", topic)
     except Exception:
         pass
 
+def get_topic_metrics(ml: bool = False) -> dict:
+    """Aggregate topic counts ({topic: count}) across all counter shards."""
+    try:
+        return get_backend().get_metrics("topics_ml" if ml else "topics")
+    except Exception:
+        return {}
+
+def _summary_from_chat_data(data) -> str:
+    if data is None:
+        return ""
+    return data.get("summary", "") or ""
+
+def _name_from_chat_data(data):
+    if data is None:
+        return None
+    profile = data.get("profile", {}) or {}
+    name = profile.get("name")
+    return name.strip() if isinstance(name, str) and name.strip() else None
+
+def _timezone_from_chat_data(data):
+    if data is None:
+        return None
+    profile = data.get("profile", {}) or {}
+    tz = profile.get("timezone")
+    return tz.strip() if isinstance(tz, str) and tz.strip() else None
+
+def _profile_note_from_chat_data(data) -> str:
+    if data is None:
+        return ""
+    profile = data.get("profile", {}) or {}
+    note = profile.get("profileNote") or ""
+    return note.strip()
+
+def _plan_from_chat_data(data) -> str:
+    if FORCE_PLAN:
+        return FORCE_PLAN
+    if data is None:
+        return "free"
+    usage = data.get("usage", {}) or {}
+    stored_plan = usage.get("plan")
+    if isinstance(stored_plan, str) and stored_plan.strip():
+        return stored_plan.strip().lower()
+    return "free"
+
+def _save_chat_fields(username, fields: dict):
+    if not username:
+        return
+    try:
+        get_backend().merge_chat(username, fields)
+    finally:
+        invalidate_chat_snapshot(username)
+
+# The profile getters below raise StorageUnavailable when the chat doc can't be read
+# (see ChatDocSnapshot.get); None / "" / "free" mean the field really is unset.
+
 def get_chat_summary(username):
     """Load a short, durable summary of the chat from Firestore"""
-    db = get_db()
-    if db is None: return ""
-    doc_ref = db.collection("chats").document(username)
-    doc = doc_ref.get()
-    if not doc.exists:
-        return ""
-    return doc.to_dict().get("summary", "") or ""
+    return _summary_from_chat_data(_get_chat_data(username))
 
 def save_chat_summary(username, summary):
     """Save/update the short summary for this user"""
-    db = get_db()
-    if db is None: return
-    doc_ref = db.collection("chats").document(username)
-    doc_ref.set({"summary": summary}, merge=True)
+    _save_chat_fields(username, {"summary": summary})
 
 def get_user_name(username):
-    db = get_db()
-    if db is None: return None
-    doc_ref = db.collection("chats").document(username)
-    doc = doc_ref.get()
-    if not doc.exists:
-        return None
-    profile = doc.to_dict().get("profile", {})
-    name = profile.get("name")
-    return name.strip() if isinstance(name, str) and name.strip() else None
+    return _name_from_chat_data(_get_chat_data(username))
 
 def save_user_name(username, name):
-    db = get_db()
-    if db is None: return
-    doc_ref = db.collection("chats").document(username)
-    doc_ref.set({"profile": {"name": name}}, merge=True)
+    _save_chat_fields(username, {"profile": {"name": name}})
 
 def get_user_timezone(username):
     """Return the user's preferred timezone / city string."""
-    db = get_db()
-    if db is None: return None
-    doc_ref = db.collection("chats").document(username)
-    doc = doc_ref.get()
-    if not doc.exists:
-        return None
-    profile = doc.to_dict().get("profile", {})
-    tz = profile.get("timezone")
-    return tz.strip() if isinstance(tz, str) and tz.strip() else None
+    return _timezone_from_chat_data(_get_chat_data(username))
 
 def save_user_timezone(username, timezone_str):
     """Persist the user's preferred timezone string on their profile."""
-    db = get_db()
-    if db is None: return
-    doc_ref = db.collection("chats").document(username)
-    doc_ref.set({"profile": {"timezone": timezone_str}}, merge=True)
+    _save_chat_fields(username, {"profile": {"timezone": timezone_str}})
 
 def get_user_profile_note(username):
     """Short, free-text note the user shares about themselves."""
-    db = get_db()
-    if db is None: return ""
-    doc_ref = db.collection("chats").document(username)
-    doc = doc_ref.get()
-    if not doc.exists:
-        return ""
-    profile = doc.to_dict().get("profile", {})
-    note = profile.get("profileNote") or ""
-    return note.strip()
+    return _profile_note_from_chat_data(_get_chat_data(username))
 
 def save_user_profile_note(username, note):
     """Persist the user's optional profile note."""
-    db = get_db()
-    if db is None: return
     clean = (note or "").strip()
-    doc_ref = db.collection("chats").document(username)
-    doc_ref.set({"profile": {"profileNote": clean}}, merge=True)
+    _save_chat_fields(username, {"profile": {"profileNote": clean}})
 
 def get_user_plan(username) -> str:
     """
@@ -517,100 +897,261 @@ def get_user_plan(username) -> str:
     """
     if FORCE_PLAN:
         return FORCE_PLAN
-    plan = "free"
-    db = get_db()
-    if db is None:
-        return plan
-    doc_ref = _get_chat_doc(username)
-    if doc_ref is None:
-        return plan
-    try:
-        doc = doc_ref.get()
-        if not doc.exists:
-            return plan
-        data = doc.to_dict() or {}
-        usage = data.get("usage", {}) or {}
-        stored_plan = usage.get("plan")
-        if isinstance(stored_plan, str) and stored_plan.strip():
-            return stored_plan.strip().lower()
-    except Exception:
-        pass
-    return plan
+    return _plan_from_chat_data(_get_chat_data(username))
 
 def get_daily_message_count(username, date_str: str) -> int:
-    db = get_db()
-    if db is None:
-        return 0
-    ref = _daily_usage_doc(username, date_str)
-    if ref is None:
+    if not username:
         return 0
     try:
-        doc = ref.get()
-        if not doc.exists:
-            return 0
-        data = doc.to_dict() or {}
-        return int(data.get("count") or 0)
+        return get_backend().get_daily_count(username, date_str)
     except Exception:
         return 0
 
 def increment_daily_message_count(username, date_str: str, amount: int = 1):
     """
-    Atomically increment a per-day counter in Firestore:
+    Atomically increment a per-day counter:
     usage/{username}/daily/{YYYY-MM-DD}.count
     """
-    db = get_db()
-    if db is None:
-        return
-    ref = _daily_usage_doc(username, date_str)
-    if ref is None:
+    if not username:
         return
     try:
-        ref.set(
-            {
-                "count": firestore.Increment(int(amount)),
-                "updatedAt": datetime.datetime.now(datetime.timezone.utc),
-            },
-            merge=True,
-        )
+        _buffered("increment_daily_count", username, date_str, int(amount))
     except Exception:
         pass
+    daily_quota.note_increment(username, date_str, amount)
 
-def _delete_all_docs_in_collection(collection_ref, batch_size: int = 250) -> None:
+class DailyQuota:
     """
-    Best-effort deletion of every document in a collection.
-    Firestore does not cascade delete subcollections when parent docs are deleted,
-    so account deletion must explicitly remove subcollection documents too.
+    Process-wide cache of each user's message count for the day.
+    Reruns read the cached count (zero storage reads once warm); sending a message
+    bumps it optimistically and then runs the backend's transactional
+    check-and-increment, whose result is written back as the authoritative count.
     """
-    db = get_db()
-    if db is None or collection_ref is None:
-        return
-    try:
-        batch_size = int(batch_size)
-    except Exception:
-        batch_size = 250
-    if batch_size <= 0:
-        batch_size = 250
 
-    while True:
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def cached_count(self, username, date_str: str) -> int | None:
+        with self._lock:
+            return self._counts.get((username, date_str))
+
+    def seed(self, username, date_str: str, count: int):
+        with self._lock:
+            self._counts[(username, date_str)] = int(count)
+            # Drop other days' entries for this user so the cache doesn't grow forever.
+            for key in [k for k in self._counts if k[0] == username and k[1] != date_str]:
+                del self._counts[key]
+
+    def count(self, username, date_str: str) -> int:
+        cached = self.cached_count(username, date_str)
+        if cached is not None:
+            return cached
+        count = get_daily_message_count(username, date_str)
+        self.seed(username, date_str, count)
+        return count
+
+    def forget(self, username):
+        with self._lock:
+            for key in [k for k in self._counts if k[0] == username]:
+                del self._counts[key]
+
+    def note_increment(self, username, date_str: str, amount: int = 1):
+        with self._lock:
+            key = (username, date_str)
+            if key in self._counts:
+                self._counts[key] += int(amount)
+
+    def try_consume(self, username, date_str: str, limit: int | None, amount: int = 1) -> bool:
+        """Reserve `amount` messages for today. Returns False if the limit is reached."""
+        if not username:
+            return False
+        if limit is None:
+            increment_daily_message_count(username, date_str, amount)
+            return True
+
+        key = (username, date_str)
+        with self._lock:
+            previous = self._counts.get(key)
+            if previous is not None and previous + amount > limit:
+                return False
+            if previous is not None:
+                self._counts[key] = previous + amount
+
         try:
-            docs = collection_ref.limit(batch_size).get()
-        except Exception:
-            return
-        if not docs:
-            return
+            allowed, count = get_backend().consume_daily_quota(username, date_str, amount, limit)
+        except Exception as e:
+            # Storage unreachable: keep the optimistic count and let the message through,
+            # as the old best-effort increment did.
+            print(f"Quota check failed: {e}")
+            return True
+
+        self.seed(username, date_str, count)
+        return allowed
+
+daily_quota = DailyQuota()
+
+def consume_daily_quota(username, date_str: str, limit: int | None, amount: int = 1) -> bool:
+    return daily_quota.try_consume(username, date_str, limit, amount)
+
+class DeletionJob:
+    """
+    Progress handle for an account wipe. The chats, usage and users deletions run
+    concurrently on a background pool; callers poll `deleted` and `done` (or block
+    on `wait`) instead of freezing the script thread until everything is gone.
+    """
+
+    def __init__(self):
+        self.deleted = 0
+        self.errors = []
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._finished = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._finished.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until the job finishes (or timeout). Returns True once done."""
+        return self._finished.wait(timeout)
+
+    def _add_deleted(self, n: int):
+        with self._lock:
+            self.deleted += int(n)
+
+    def _run(self, label: str, fn, *args):
         try:
-            batch = db.batch()
-            for d in docs:
-                batch.delete(d.reference)
-            batch.commit()
-        except Exception:
-            for d in docs:
-                try:
-                    d.reference.delete()
-                except Exception:
-                    pass
-        if len(docs) < batch_size:
+            fn(*args, on_deleted=self._add_deleted)
+        except Exception as e:
+            with self._lock:
+                self.errors.append(f"{label}: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+                finished = self._pending == 0
+            if finished:
+                self._finished.set()
+
+    def _start(self, tasks, on_finish=None):
+        self._pending = len(tasks)
+        if not tasks:
+            self._finished.set()
+        for label, fn, args in tasks:
+            _deletion_pool.submit(self._run, label, fn, *args)
+        if on_finish is not None:
+            def _after():
+                self.wait()
+                on_finish()
+            threading.Thread(target=_after, daemon=True).start()
+
+_deletion_pool = ThreadPoolExecutor(max_workers=6, thread_name_prefix="clara-delete")
+
+def start_account_deletion(username: str, user_id: str | None) -> DeletionJob:
+    """
+    Begin deleting chats/{username} (+ messages), usage/{username} (+ daily) and
+    users/{user_id} concurrently. Returns immediately with a DeletionJob.
+    """
+    job = DeletionJob()
+    try:
+        backend = get_backend()
+    except Exception as e:
+        job.errors.append(str(e))
+        job._start([])
+        return job
+
+    tasks = []
+    if username:
+        tasks.append(("chat", backend.delete_chat, (username,)))
+        tasks.append(("usage", backend.delete_usage, (username,)))
+    if user_id:
+        tasks.append(("user", backend.delete_user, (user_id,)))
+
+    def _forget_cached_state():
+        if username:
+            invalidate_chat_snapshot(username)
+            daily_quota.forget(username)
+
+    _forget_cached_state()
+    job._start(tasks, on_finish=_forget_cached_state)
+    return job
+
+# --- Data export ---
+
+def _export_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+def iter_user_export(username: str, user_id: str | None = None, include_memories: bool = True):
+    """
+    Yield one dict per exported record: the chat doc, the user doc, every message
+    (archived and live, oldest first), every daily usage doc and every stored memory. Everything is
+    read page by page, so memory use doesn't grow with the size of the history.
+    """
+    if not username:
+        return
+    backend = get_backend()
+    yield {"type": "export", "chatId": username, "exportedAt": datetime.datetime.now(datetime.timezone.utc)}
+
+    chat = backend.get_chat(username)
+    if chat is not None:
+        yield {"type": "chat", "data": chat}
+    if user_id:
+        user = backend.get_user(user_id)
+        if user is not None:
+            yield {"type": "user", "data": user}
+
+    for archive in backend.iter_archives(username):
+        for message in archive.get("messages") or []:
+            yield {"type": "message", **message}
+    for message in backend.iter_messages(username):
+        yield {"type": "message", **message}
+    for date_str, data in backend.iter_daily_usage(username):
+        yield {"type": "usage_daily", "date": date_str, **data}
+
+    if include_memories:
+        try:
+            from clara_app.services import memory
+        except Exception as e:
+            print(f"Memory export unavailable: {e}")
             return
+        for item in memory.iter_memories(username):
+            yield {"type": "memory", **item}
+
+def iter_export_ndjson(username: str, user_id: str | None = None):
+    """The export as NDJSON, one encoded line per record."""
+    for record in iter_user_export(username, user_id):
+        yield (json.dumps(record, default=_export_default, ensure_ascii=False) + "\n").encode("utf-8")
+
+class _ZipChunks:
+    """Write-only sink for ZipFile; zipfile streams (data descriptors) when it can't seek."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        chunks, self._chunks = self._chunks, []
+        return b"".join(chunks)
+
+def iter_export_zip(username: str, user_id: str | None = None):
+    """The NDJSON export as a single-entry zip, yielded in compressed chunks as it is built."""
+    sink = _ZipChunks()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        with zf.open("clara-export.ndjson", "w", force_zip64=True) as entry:
+            for line in iter_export_ndjson(username, user_id):
+                entry.write(line)
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+    yield sink.drain()
 
 def delete_user_account(username: str, user_id: str | None):
     """
@@ -619,32 +1160,9 @@ def delete_user_account(username: str, user_id: str | None):
     - users/{user_id} (if provided)
     - usage/{username}
     Subcollections (like messages) are deleted so data is actually removed.
+    Blocks until done; use start_account_deletion for a pollable job.
     """
-    db = get_db()
-    if db is None:
-        return
-    try:
-        if username:
-            try:
-                chat_ref = db.collection("chats").document(username)
-                _delete_all_docs_in_collection(chat_ref.collection("messages"))
-                chat_ref.delete()
-            except Exception:
-                pass
-            try:
-                usage_ref = db.collection("usage").document(username)
-                _delete_all_docs_in_collection(usage_ref.collection("daily"))
-                usage_ref.delete()
-            except Exception:
-                pass
-        if user_id:
-            try:
-                db.collection("users").document(user_id).delete()
-            except Exception:
-                pass
-    except Exception:
-        # Account deletion should never crash the app
-        pass
+    start_account_deletion(username, user_id).wait()
 
 def delete_entire_account(username: str, user_id: str | None):
     """
@@ -652,32 +1170,6 @@ def delete_entire_account(username: str, user_id: str | None):
     1. chats/{username} -> Contains history, profile, and name.
     2. usage/{username}  -> Contains daily limits.
     3. users/{user_id}   -> Contains the sensitive PII (email).
+    Blocks until done; use start_account_deletion for a pollable job.
     """
-    db = get_db()
-    if db is None:
-        return
-
-    # 1. Delete Chat & Profile
-    if username:
-        try:
-            chat_ref = db.collection("chats").document(username)
-            _delete_all_docs_in_collection(chat_ref.collection("messages"))
-            chat_ref.delete()
-        except Exception:
-            pass
-
-    # 2. Delete Usage Stats
-    if username:
-        try:
-            usage_ref = db.collection("usage").document(username)
-            _delete_all_docs_in_collection(usage_ref.collection("daily"))
-            usage_ref.delete()
-        except Exception:
-            pass
-
-    # 3. Delete Identity (The Email Record)
-    if user_id:
-        try:
-            db.collection("users").document(user_id).delete()
-        except Exception:
-            pass
+    start_account_deletion(username, user_id).wait()
@@ -0,0 +1,192 @@
+import asyncio
+import threading
+from firebase_admin import firestore
+
+from clara_app.constants import CHAT_VIEW_LOAD_TIMEOUT_SECONDS
+from clara_app.services import storage
+
+# Scope: this module is the chat view's read path only. load_chat_view fetches the
+# chat doc, today's usage count and the newest history page concurrently in one
+# event-loop hop. Writes, metrics, older history pages and the other getters stay in
+# the sync storage module, which also serves non-Firestore backends and is what
+# load_chat_view falls back to whenever the async reads can't be used.
+
+# The AsyncClient's gRPC channel is bound to the event loop it was first used on,
+# so every coroutine in this module runs on one long-lived loop in a daemon thread.
+_loop = None
+_loop_lock = threading.Lock()
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="clara-storage-async", daemon=True).start()
+            _loop = loop
+    return _loop
+
+def run(coro, timeout: float | None = 30):
+    """Run a coroutine on the storage loop and block until it finishes."""
+    future = asyncio.run_coroutine_threadsafe(coro, _get_loop())
+    return future.result(timeout)
+
+def get_async_db():
+    """
+    Return the shared AsyncClient, or None if Firebase is unavailable. Call from the
+    storage loop. It comes from storage's FirestoreClientManager, so it is health
+    checked and replaced along with the sync client.
+    """
+    try:
+        return storage._client_manager.async_client()
+    except Exception as e:
+        print(f"Error creating async Firestore client: {e}")
+        return None
+
+def _call_options() -> dict:
+    # Short deadline: a stale channel should hand over to the sync fallback quickly.
+    return storage._client_manager.async_call_options(timeout=CHAT_VIEW_LOAD_TIMEOUT_SECONDS)
+
+def _chat_doc(username):
+    db = get_async_db()
+    if db is None or not username:
+        return None
+    return db.collection("chats").document(username)
+
+def _daily_usage_doc(username, date_str: str):
+    db = get_async_db()
+    if db is None or not username:
+        return None
+    return db.collection("usage").document(username).collection("daily").document(date_str)
+
+# --- Reads ---
+
+# Read errors propagate: load_chat_view then falls back to the sync getters instead
+# of caching a failed read as "no chat doc" / "no messages sent today".
+
+async def get_chat_data(username):
+    """Fetch the CHAT_PROFILE_FIELDS of chats/{username} as a dict, or None if it is missing."""
+    doc_ref = _chat_doc(username)
+    if doc_ref is None:
+        return None
+    doc = await doc_ref.get(field_paths=storage.CHAT_PROFILE_FIELDS, **_call_options())
+    data = (doc.to_dict() or {}) if doc.exists else None
+    storage.read_meter.record("chat_profile", data)
+    return data
+
+async def get_daily_message_count(username, date_str: str) -> int:
+    ref = _daily_usage_doc(username, date_str)
+    if ref is None:
+        return 0
+    doc = await ref.get(**_call_options())
+    if not doc.exists:
+        return 0
+    return int((doc.to_dict() or {}).get("count") or 0)
+
+async def _recent_message_docs(username, limit: int):
+    """Newest-first message dicts."""
+    doc_ref = _chat_doc(username)
+    if doc_ref is None:
+        return []
+    q = doc_ref.collection("messages").order_by("ts", direction=firestore.Query.DESCENDING).order_by("__name__", direction=firestore.Query.DESCENDING)
+    return [dict(d.to_dict() or {}, id=d.id) for d in await q.limit(limit).get(**_call_options())]
+
+# --- Chat view loader ---
+
+async def _load_chat_view(username, date_str: str, history_limit: int | None, cached_count: int | None, read_chat: bool):
+    if get_async_db() is None:
+        # Otherwise every read below would come back as "missing".
+        raise RuntimeError("async Firestore client unavailable")
+    # History is queried without the clearedAt filter so it doesn't have to wait for
+    # the chat doc; the cutoff is applied locally below, which yields the same rows.
+    # One row past the page tells whether an older page exists.
+    history_task = _recent_message_docs(username, history_limit + 1) if history_limit else asyncio.sleep(0, result=[])
+    # Once the quota cache is warm, reruns don't read the usage doc at all.
+    count_task = get_daily_message_count(username, date_str) if cached_count is None else asyncio.sleep(0, result=cached_count)
+    # A fresh ChatDocSnapshot (see load_chat_view) spares the chat-doc read.
+    chat_task = get_chat_data(username) if read_chat else asyncio.sleep(0, result=None)
+    chat_data, daily_count, message_docs = await asyncio.gather(
+        chat_task,
+        count_task,
+        history_task,
+    )
+    return chat_data, daily_count, message_docs
+
+def _newer_than(message, cutoff) -> bool:
+    ts = message.get("ts")
+    return ts is not None and ts > cutoff
+
+def _chat_view(chat_data, daily_count: int, history, history_cursor, profile_loaded: bool = True) -> dict:
+    if not profile_loaded:
+        profile = {"plan": None, "name": None, "summary": "", "profile_note": "", "timezone": None}
+    else:
+        profile = {
+            "plan": storage._plan_from_chat_data(chat_data),
+            "name": storage._name_from_chat_data(chat_data),
+            "summary": storage._summary_from_chat_data(chat_data),
+            "profile_note": storage._profile_note_from_chat_data(chat_data),
+            "timezone": storage._timezone_from_chat_data(chat_data),
+        }
+    return {
+        **profile,
+        "profile_loaded": profile_loaded,
+        "daily_count": daily_count,
+        "history": history,
+        "history_cursor": history_cursor,
+    }
+
+def _load_chat_view_sync(username, date_str: str, history_limit: int | None) -> dict:
+    history, history_cursor = None, None
+    if history_limit:
+        history, history_cursor = storage.get_chat_history_page(username, page_size=history_limit)
+    try:
+        chat_data, profile_loaded = storage._get_chat_data(username), True
+    except storage.StorageUnavailable as e:
+        print(f"Chat doc unavailable, profile unknown for this rerun: {e}")
+        chat_data, profile_loaded = None, False
+    return _chat_view(chat_data, storage.daily_quota.count(username, date_str), history, history_cursor, profile_loaded)
+
+def load_chat_view(username, date_str: str, history_limit: int | None = storage.HISTORY_PAGE_SIZE) -> dict:
+    """
+    Fetch everything a chat-view rerun needs in one event-loop hop: the chat doc
+    (plan, name, summary, profile note, timezone, clearedAt), today's usage count
+    and, if history_limit is set, the newest history page plus its cursor.
+    The chat doc comes from the ChatDocSnapshot while it is fresh. Uses the sync
+    storage getters when the backend isn't Firestore, the async client is
+    unavailable or any async read fails (failed reads are never cached). If even
+    the sync read of the chat doc fails, "profile_loaded" is False and the profile
+    fields are placeholders, not the user's values.
+    """
+    if not storage.uses_firestore():
+        return _load_chat_view_sync(username, date_str, history_limit)
+    try:
+        cached_count = storage.daily_quota.cached_count(username, date_str)
+        snapshot_fresh, snapshot = storage._chat_snapshots.peek(username)
+        chat_data, daily_count, message_docs = run(
+            _load_chat_view(username, date_str, history_limit, cached_count, read_chat=not snapshot_fresh),
+            timeout=CHAT_VIEW_LOAD_TIMEOUT_SECONDS + 1,
+        )
+    except Exception as e:
+        print(f"Async chat view load failed, using sync storage: {e}")
+        return _load_chat_view_sync(username, date_str, history_limit)
+
+    if snapshot_fresh:
+        chat_data = snapshot
+    else:
+        # Later sync getters in this rerun (sidebar, profile dialog) are served from memory.
+        storage._chat_snapshots.put(username, chat_data)
+    if cached_count is None:
+        storage.daily_quota.seed(username, date_str, daily_count)
+
+    history, history_cursor = None, None
+    if history_limit:
+        cleared_at = (chat_data or {}).get("clearedAt")
+        if cleared_at:
+            message_docs = [d for d in message_docs if _newer_than(d, cleared_at)]
+        message_docs = storage._with_archived(username, message_docs, history_limit + 1, cleared_at)
+        if message_docs:
+            message_docs, history_cursor = storage._split_page(message_docs, history_limit)
+            history = storage._messages_from_docs(reversed(message_docs))
+        else:
+            history = storage._legacy_history(username, history_limit)
+
+    return _chat_view(chat_data, daily_count, history, history_cursor)
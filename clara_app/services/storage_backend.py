@@ -0,0 +1,236 @@
+import datetime
+import threading
+
+# Placeholder for "the time this write lands". Firestore resolves it server-side;
+# other backends substitute the local UTC clock.
+SERVER_TIMESTAMP = object()
+
+class StorageUnavailable(RuntimeError):
+    """Raised by a backend when its database cannot be reached."""
+
+class WriteOutcomeUnknown(RuntimeError):
+    """Raised when a write failed without saying whether it was applied (e.g. a timeout); don't re-send it."""
+
+class StorageBackend:
+    """
+    The persistence operations storage.py relies on, independent of the database.
+    Collections mirror the Firestore layout:
+    - chats/{chat_id} (+ messages, + archives of compacted messages)
+    - usage/{chat_id} (+ daily/{YYYY-MM-DD})
+    - users/{user_id}
+    - beta_keys/{code}
+    - metrics/{doc_id}
+    Messages are plain dicts with `role`, `content` and a tz-aware `ts`.
+    """
+
+    name = "base"
+
+    # --- chats ---
+    def get_chat(self, chat_id: str, fields: list[str] | None = None) -> dict | None:
+        """
+        The chat doc as a dict, or None if it doesn't exist. `fields` limits the read
+        to those (dotted) field paths; None reads the whole doc.
+        """
+        raise NotImplementedError
+
+    def merge_chat(self, chat_id: str, fields: dict) -> None:
+        """Deep-merge fields into the chat doc, creating it if needed."""
+        raise NotImplementedError
+
+    def delete_chat(self, chat_id: str, on_deleted=None) -> None:
+        """
+        Delete the chat doc and every message under it.
+        on_deleted(n), if given, is called as documents are removed (for progress).
+        """
+        raise NotImplementedError
+
+    # --- messages ---
+    def add_message(self, chat_id: str, message: dict) -> None:
+        """
+        Store a message. If it carries an `id`, that id is used and the write is
+        idempotent: a message with that id that already exists is left untouched.
+        """
+        raise NotImplementedError
+
+    def list_messages(self, chat_id: str, *, after_ts=None, before=None, limit: int = 60) -> list[dict]:
+        """
+        Messages newer than after_ts and, if `before` is a (ts, id) key, ordered
+        before it; newest first, ties on ts broken by id (descending).
+        """
+        raise NotImplementedError
+
+    def iter_messages(self, chat_id: str, page_size: int = 500):
+        """Every message of a chat, oldest first, fetched page by page."""
+        raise NotImplementedError
+
+    def iter_chat_ids(self):
+        """Every chat id that has a doc or messages."""
+        raise NotImplementedError
+
+    # --- message archives ---
+    # An archive holds a run of old messages (oldest first) in one doc:
+    # {"id", "startTs", "endTs", "count", "messages": [{"id", "role", "content", "ts"}, ...]}.
+    # Archives never overlap and are always older than the live messages.
+    def list_archives(self, chat_id: str, *, until_ts=None, limit: int = 2) -> list[dict]:
+        """Archives with startTs <= until_ts, newest first."""
+        raise NotImplementedError
+
+    def iter_archives(self, chat_id: str):
+        """Every archive of a chat, oldest first."""
+        raise NotImplementedError
+
+    def write_archive(self, chat_id: str, archive: dict) -> None:
+        """Store an archive and delete the live messages it contains, atomically."""
+        raise NotImplementedError
+
+    # --- usage ---
+    def get_daily_count(self, chat_id: str, date_str: str) -> int:
+        raise NotImplementedError
+
+    def increment_daily_count(self, chat_id: str, date_str: str, amount: int = 1) -> None:
+        raise NotImplementedError
+
+    def consume_daily_quota(self, chat_id: str, date_str: str, amount: int = 1, limit: int | None = None) -> tuple[bool, int]:
+        """
+        Atomically add `amount` to the day's count unless that would exceed `limit`
+        (None = unlimited). Returns (allowed, count after the call).
+        """
+        raise NotImplementedError
+
+    def iter_daily_usage(self, chat_id: str):
+        """Yield (date_str, data) for each usage/{chat_id}/daily doc."""
+        raise NotImplementedError
+
+    def delete_usage(self, chat_id: str, on_deleted=None) -> None:
+        """Delete the usage doc and all of its daily counters."""
+        raise NotImplementedError
+
+    # --- users ---
+    def get_user(self, user_id: str) -> dict | None:
+        raise NotImplementedError
+
+    def merge_user(self, user_id: str, fields: dict) -> None:
+        raise NotImplementedError
+
+    def delete_user(self, user_id: str, on_deleted=None) -> None:
+        raise NotImplementedError
+
+    # --- beta keys ---
+    def get_beta_key(self, code: str) -> dict | None:
+        raise NotImplementedError
+
+    def merge_beta_key(self, code: str, fields: dict) -> None:
+        raise NotImplementedError
+
+    # --- metrics ---
+    def increment_metric(self, doc_id: str, field: str, amount: int = 1) -> None:
+        raise NotImplementedError
+
+    def increment_metrics(self, doc_id: str, counts: dict) -> None:
+        """Apply several field increments to one metrics doc."""
+        for field, amount in counts.items():
+            self.increment_metric(doc_id, field, amount)
+
+    def get_metrics(self, doc_id: str) -> dict:
+        """Current totals for a metrics doc, as {field: count}."""
+        raise NotImplementedError
+
+    # --- batching ---
+    def apply_writes(self, ops: list) -> None:
+        """
+        Apply buffered writes, given as (method_name, args) tuples naming one of the
+        write methods above. Backends override this to commit them in one batch.
+        Raises WriteOutcomeUnknown if some ops may or may not have been applied.
+        """
+        for method, args in ops:
+            getattr(self, method)(*args)
+
+def utc_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def resolve_server_timestamps(fields: dict) -> dict:
+    """Replace SERVER_TIMESTAMP placeholders (at any depth) with the local UTC time."""
+    resolved = {}
+    for key, value in fields.items():
+        if value is SERVER_TIMESTAMP:
+            resolved[key] = utc_now()
+        elif isinstance(value, dict):
+            resolved[key] = resolve_server_timestamps(value)
+        else:
+            resolved[key] = value
+    return resolved
+
+def deep_merge(base: dict, updates: dict) -> dict:
+    """Merge nested dicts the way Firestore's set(..., merge=True) does."""
+    merged = dict(base)
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def project_fields(data: dict, fields: list[str] | None) -> dict:
+    """Keep only the given dotted field paths of a doc, like a Firestore field mask."""
+    if fields is None:
+        return data
+    projected = {}
+    for path in fields:
+        parts = path.split(".")
+        value = data
+        for part in parts:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            target = projected
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+    return projected
+
+def approx_doc_bytes(value) -> int:
+    """
+    Approximate size of a doc (or field value) using Firestore's storage size rules:
+    strings are UTF-8 length + 1, numbers and timestamps 8, booleans and null 1,
+    maps the sum of key (+1) and value sizes. Close to what a read puts on the wire.
+    """
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime.datetime)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, bytes):
+        return len(value) + 1
+    if isinstance(value, dict):
+        return sum(len(str(k).encode("utf-8")) + 1 + approx_doc_bytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(approx_doc_bytes(v) for v in value)
+    return 8
+
+class ReadMeter:
+    """Per-label count of document reads and approximate bytes returned."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, label: str, data) -> None:
+        size = approx_doc_bytes(data) if data is not None else 0
+        with self._lock:
+            entry = self._stats.setdefault(label, {"calls": 0, "bytes": 0})
+            entry["calls"] += 1
+            entry["bytes"] += size
+
+    def stats(self) -> dict:
+        """{label: {"calls", "bytes", "avg_bytes"}} since the last reset."""
+        with self._lock:
+            return {
+                label: dict(entry, avg_bytes=entry["bytes"] // max(1, entry["calls"]))
+                for label, entry in self._stats.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
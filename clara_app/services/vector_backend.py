@@ -0,0 +1,142 @@
+from typing import Any, Dict, List, NamedTuple, Optional
+
+class VectorMatch(NamedTuple):
+    id: str
+    score: Optional[float]
+    metadata: Dict[str, Any]
+    values: Optional[List[float]] = None
+
+class VectorBackend:
+    """
+    The vector-store operations memory.py relies on, shaped after the Pinecone
+    index API: namespaced upsert / query / list / fetch / delete, cosine scores,
+    and Pinecone-style metadata filters (see matches_filter).
+    Vectors are dicts with `id`, `values` and `metadata`.
+    """
+
+    name = "base"
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = "") -> None:
+        raise NotImplementedError
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int,
+        namespace: str = "",
+        filter: Optional[Dict[str, Any]] = None,
+        include_values: bool = False,
+    ) -> List[VectorMatch]:
+        """Best matches by cosine similarity, highest score first."""
+        raise NotImplementedError
+
+    def list_ids(self, namespace: str = "", prefix: Optional[str] = None, page_size: int = 100):
+        """Yield pages (lists) of vector ids in a namespace, optionally by id prefix."""
+        raise NotImplementedError
+
+    def fetch(self, ids: List[str], namespace: str = "") -> Dict[str, VectorMatch]:
+        """The stored vectors for the given ids (missing ids are left out)."""
+        raise NotImplementedError
+
+    def update_metadata(self, vector_id: str, metadata: Dict[str, Any], namespace: str = "") -> None:
+        """Set the given metadata fields on a stored vector (other fields are kept)."""
+        raise NotImplementedError
+
+    def delete(self, ids: List[str], namespace: str = "") -> None:
+        raise NotImplementedError
+
+    def delete_namespace(self, namespace: str) -> None:
+        raise NotImplementedError
+
+def _compare(op: str, value, expected) -> bool:
+    if op == "$eq":
+        return value == expected
+    if op == "$ne":
+        return value != expected
+    if op == "$in":
+        return value in expected
+    if op == "$nin":
+        return value not in expected
+    if value is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > expected
+        if op == "$gte":
+            return value >= expected
+        if op == "$lt":
+            return value < expected
+        if op == "$lte":
+            return value <= expected
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """
+    Evaluate a Pinecone metadata filter against one vector's metadata.
+    Supports $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte, the {"field": value} shorthand for
+    $eq, and $and/$or. Sibling conditions are ANDed.
+    """
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, c) for c in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            if not all(_compare(op, value, expected) for op, expected in condition.items()):
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+class PineconeVectorBackend(VectorBackend):
+    """VectorBackend over a pinecone.Index."""
+
+    name = "pinecone"
+
+    def __init__(self, index):
+        self.index = index
+
+    @staticmethod
+    def _match(m, score=None) -> VectorMatch:
+        values = list(m.values) if getattr(m, "values", None) else None
+        return VectorMatch(m.id, getattr(m, "score", score), dict(m.metadata or {}), values)
+
+    def upsert(self, vectors, namespace=""):
+        self.index.upsert(vectors=vectors, namespace=namespace)
+
+    def query(self, vector, top_k, namespace="", filter=None, include_values=False):
+        results = self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True,
+            include_values=include_values,
+            namespace=namespace,
+            filter=filter,
+        )
+        return [self._match(m) for m in results.matches]
+
+    def list_ids(self, namespace="", prefix=None, page_size=100):
+        kwargs = {"prefix": prefix} if prefix else {}
+        for ids in self.index.list(namespace=namespace, limit=page_size, **kwargs):
+            yield list(ids)
+
+    def fetch(self, ids, namespace=""):
+        vectors = self.index.fetch(ids=list(ids), namespace=namespace).vectors
+        return {vid: self._match(v) for vid, v in vectors.items()}
+
+    def update_metadata(self, vector_id, metadata, namespace=""):
+        self.index.update(id=vector_id, set_metadata=metadata, namespace=namespace)
+
+    def delete(self, ids, namespace=""):
+        if ids:
+            self.index.delete(ids=list(ids), namespace=namespace)
+
+    def delete_namespace(self, namespace):
+        self.index.delete(delete_all=True, namespace=namespace)
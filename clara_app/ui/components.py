@@ -1,5 +1,6 @@
 import streamlit as st
 import html
+import io
 import pandas as pd
 from clara_app.constants import RETRO_UI
 from clara_app.services import storage
@@ -136,12 +137,19 @@ def render_privacy_policy_page():
 def edit_profile_dialog():
     st.write("Update your details below to help Clara understand you better.")
     
+    try:
+        current_name = st.session_state.get("display_name") or storage.get_user_name(st.session_state.username) or ""
+        current_note = storage.get_user_profile_note(st.session_state.username)
+        current_timezone = storage.get_user_timezone(st.session_state.username) or ""
+    except storage.StorageUnavailable:
+        # Saving over fields that couldn't be read would blank them.
+        st.error("Your profile couldn't be loaded just now. Please close this and try again.")
+        return
+
     # 0. Name
-    current_name = st.session_state.get("display_name") or storage.get_user_name(st.session_state.username) or ""
     new_name = st.text_input("Your Name", value=current_name, placeholder="What should I call you?")
 
     # 1. Profile Note
-    current_note = storage.get_user_profile_note(st.session_state.username)
     new_note = st.text_area(
         "About You",
         value=current_note,
@@ -151,7 +159,6 @@ def edit_profile_dialog():
     )
     
     # 2. Timezone / City
-    current_timezone = storage.get_user_timezone(st.session_state.username) or ""
     new_timezone = st.text_input(
         "City / Time Zone",
         value=current_timezone,
@@ -246,13 +253,68 @@ def render_sidebar():
         # Standard Footer
         st.sidebar.caption("Clara Aster™ is a trademark of ASTR Labs, LLC. © 2025 ASTR Labs, LLC.")
 
+def _show_deletion_progress(job, label):
+    """Poll a storage.DeletionJob and keep a status line updated until it finishes."""
+    with st.status(label, expanded=False) as status:
+        while not job.wait(timeout=0.3):
+            status.update(label=f"{label} {job.deleted} records removed")
+        if job.errors:
+            status.update(label="Some data could not be removed. Please try again or contact us.", state="error")
+        else:
+            status.update(label=f"Done. {job.deleted} records removed.", state="complete")
+
+def _prepare_export(username, user_id, fmt):
+    """
+    Build the streamed export in memory and return its bytes (or None on failure).
+    Nothing touches disk or session state: the bytes only live for the run that
+    renders the download button (st.download_button holds its own copy until the
+    next rerun), so no copy of the user's data outlives that.
+    """
+    chunks = storage.iter_export_zip(username, user_id) if fmt == "zip" else storage.iter_export_ndjson(username, user_id)
+    buffer = io.BytesIO()
+    with st.status("Preparing your export…", expanded=False) as status:
+        try:
+            for chunk in chunks:
+                buffer.write(chunk)
+                status.update(label=f"Preparing your export… {buffer.tell() // 1024:,} KB")
+        except Exception as e:
+            print(f"Export failed: {e}")
+            status.update(label="Your export could not be prepared. Please try again.", state="error")
+            return None
+        status.update(label=f"Export ready ({buffer.tell() // 1024:,} KB).", state="complete")
+    return buffer.getvalue()
+
 def render_account_page():
     st.markdown("## Account & Data Management")
-    st.markdown("Manage your data and account status. Use these controls to clear history, reset your profile, or delete your account permanently.")
+    st.markdown("Manage your data and account status. Use these controls to export your data, clear history, reset your profile, or delete your account permanently.")
+    st.markdown("---")
+
+    # 1. Export Data
+    st.subheader("1. Export Your Data")
+    st.markdown(
+        """
+        - **What it does:** Downloads everything Clara stores about you: your profile, full conversation history, daily usage and memories.
+        - **Format:** One JSON record per line (NDJSON), optionally zipped.
+        """
+    )
+    export_format = st.radio("Format", ["zip", "ndjson"], horizontal=True, key="export_format")
+    if st.button("Prepare Export", type="secondary"):
+        data = _prepare_export(st.session_state.username, st.session_state.user_id, export_format)
+        if data is not None:
+            # Shown only in this run; downloading (or any other click) reruns the
+            # page without it, which releases the bytes.
+            st.download_button(
+                "Download Export",
+                data=data,
+                file_name=f"clara-export.{export_format}",
+                mime="application/zip" if export_format == "zip" else "application/x-ndjson",
+                key="download_export",
+            )
+
     st.markdown("---")
 
-    # 1. Clear Chat
-    st.subheader("1. Clear Chat (Fresh Context)")
+    # 2. Clear Chat
+    st.subheader("2. Clear Chat (Fresh Context)")
     st.markdown(
         """
         - **What it does:** Wipes the active conversation window. Clara forgets the immediate discussion but retains her general understanding of you.
@@ -269,8 +331,8 @@ def render_account_page():
     
     st.markdown("---")
 
-    # 2. Account Reset
-    st.subheader("2. Account Reset (The Reboot)")
+    # 3. Account Reset
+    st.subheader("3. Account Reset (The Reboot)")
     st.markdown(
         """
         - **What it does:** Reboots your profile to Day 1. You keep your login, but Clara forgets your name, notes, and all history.
@@ -288,7 +350,8 @@ def render_account_page():
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Confirm Reset", key="page_confirm_reset_yes"):
-                storage.delete_user_account(st.session_state.username, st.session_state.user_id)
+                job = storage.start_account_deletion(st.session_state.username, st.session_state.user_id)
+                _show_deletion_progress(job, "Resetting your account…")
                 st.session_state.clear()
                 st.query_params.clear()
                 st.rerun()
@@ -299,8 +362,8 @@ def render_account_page():
 
     st.markdown("---")
 
-    # 3. Delete Account
-    st.subheader("3. Delete Account (The Shredder)")
+    # 4. Delete Account
+    st.subheader("4. Delete Account (The Shredder)")
     st.markdown(
         """
         - **What it does:** The nuclear option. It removes everything associated with you from the system.
@@ -319,7 +382,8 @@ def render_account_page():
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Permanently Delete Account", key="page_confirm_delete_account_yes"):
-                storage.delete_entire_account(st.session_state.username, st.session_state.user_id)
+                job = storage.start_account_deletion(st.session_state.username, st.session_state.user_id)
+                _show_deletion_progress(job, "Deleting your account…")
                 st.session_state.clear()
                 st.query_params.clear()
                 st.rerun()
@@ -1,11 +1,13 @@
 import streamlit as st
+import hashlib
 import datetime
 from zoneinfo import ZoneInfo
 import pandas as pd
 import random
+import uuid
 
-from clara_app.constants import FREE_DAILY_MESSAGE_LIMIT, PLUS_DAILY_MESSAGE_LIMIT, BETA_ACCESS_KEY, FIREBASE_WEB_API_KEY, MASTER_EMAILS, MASTER_DOMAINS
-from clara_app.services import storage, llm, memory, auth
+from clara_app.constants import FREE_DAILY_MESSAGE_LIMIT, PLUS_DAILY_MESSAGE_LIMIT, HISTORY_PAGE_SIZE, BETA_ACCESS_KEY, FIREBASE_WEB_API_KEY, MASTER_EMAILS, MASTER_DOMAINS
+from clara_app.services import storage, storage_async, llm, memory, auth
 from clara_app.utils import helpers
 from clara_app.ui import styles, components
 
@@ -17,6 +19,9 @@ st.set_page_config(page_title="Clara Aster", page_icon="Clara Avatars/Simple Ava
 # Initialize Firebase (The Memory & Security)
 storage.initialize_firebase()
 
+# Open the memory index in the background (once per process) so no chat turn waits on it
+memory.warm_up()
+
 # Apply Styles
 styles.apply_styles()
 
@@ -35,6 +40,8 @@ if "access_code" not in st.session_state:
     st.session_state.access_code = None
 if "show_login_anyway" not in st.session_state:
     st.session_state.show_login_anyway = False
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex[:12]
 
 @st.dialog("Enter Access Key")
 def enter_key_dialog():
@@ -264,9 +271,33 @@ if st.session_state.username is None:
 
 # --- VIEW C: THE CHAT INTERFACE ---
 else:
+    # Fetch the chat doc, today's usage and (on first load) history concurrently
+    today_str = datetime.date.today().isoformat()
+    needs_history = "messages" not in st.session_state or len(st.session_state.messages) == 0
+    chat_view = storage_async.load_chat_view(
+        st.session_state.username,
+        today_str,
+        history_limit=HISTORY_PAGE_SIZE if needs_history else None,
+    )
+
+    # A failed chat-doc read says nothing about the profile: reuse this user's last
+    # loaded one, or wait for a read that succeeds, rather than asking for a name
+    # again or assuming the free plan.
+    profile_keys = ("plan", "name", "summary", "profile_note", "timezone")
+    last_profile = st.session_state.get("chat_profile")
+    if chat_view["profile_loaded"]:
+        st.session_state.chat_profile = (st.session_state.username, {k: chat_view[k] for k in profile_keys})
+    elif last_profile and last_profile[0] == st.session_state.username:
+        chat_view.update(last_profile[1])
+    else:
+        st.warning("Clara couldn't load your profile just now. Please try again in a moment.")
+        if st.button("Try again"):
+            st.rerun()
+        st.stop()
+
     # 0. Hydrate Display Name
     if st.session_state.display_name is None:
-        st.session_state.display_name = storage.get_user_name(st.session_state.username)
+        st.session_state.display_name = chat_view["name"]
     
     # If still missing (legacy or error), we must ask
     if not st.session_state.display_name:
@@ -286,9 +317,8 @@ else:
     st.title("Clara")
 
     # 2. Plan & daily usage limits
-    plan = storage.get_user_plan(st.session_state.username)
-    today_str = datetime.date.today().isoformat()
-    message_count_today = storage.get_daily_message_count(st.session_state.username, today_str)
+    plan = chat_view["plan"]
+    message_count_today = chat_view["daily_count"]
     if plan == "plus":
         daily_limit = PLUS_DAILY_MESSAGE_LIMIT
     else:
@@ -299,15 +329,17 @@ else:
     components.render_sidebar()
 
     # 4. Load Memory (If first load)
-    if "messages" not in st.session_state or len(st.session_state.messages) == 0:
-        st.session_state.messages = storage.get_chat_history(st.session_state.username)
+    if needs_history:
+        st.session_state.messages = chat_view["history"] or []
+        # Cursor for the next older page; None once the start of history is loaded
+        st.session_state.history_cursor = chat_view["history_cursor"]
     if "topic_counts" not in st.session_state:
         st.session_state.topic_counts = {}
     
     # Initialize the Chat Object with History for Gemini
     gemini_history = []
     # Add durable summary first (if available) so Clara has a compact memory across long chats
-    summary_text = storage.get_chat_summary(st.session_state.username)
+    summary_text = chat_view["summary"]
     if summary_text:
         gemini_history.append(
             {
@@ -323,7 +355,7 @@ else:
 
     # If the user has written an explicit profile note, surface it as
     # durable context so Clara can tailor conversations more precisely.
-    profile_note = storage.get_user_profile_note(st.session_state.username)
+    profile_note = chat_view["profile_note"]
     if profile_note:
         gemini_history.append(
             {
@@ -340,7 +372,7 @@ else:
         london_str = london_now.strftime("%A, %H:%M")
         time_context = f"[CONTEXT] Time context: Right now it’s {london_str} in London."
 
-        user_timezone = storage.get_user_timezone(st.session_state.username)
+        user_timezone = chat_view["timezone"]
         if user_timezone:
             tz_key = user_timezone.strip()
             # Basic mapping from common city names to IANA timezone IDs
@@ -406,7 +438,16 @@ else:
             else:
                 st.caption("No matches in this chat yet.")
 
-    # 5. Display Chat History
+    # 5. Display Chat History (newest page first, older pages on demand)
+    if st.session_state.get("history_cursor") is not None:
+        if st.button("Load older messages", key="load_older_history"):
+            older, st.session_state.history_cursor = storage.get_chat_history_page(
+                st.session_state.username,
+                before=st.session_state.history_cursor,
+            )
+            st.session_state.messages = older + st.session_state.messages
+            st.rerun()
+
     for message in st.session_state.messages:
         components.render_chat_message(message["role"], message["content"])
 
@@ -437,150 +478,160 @@ else:
         # Prioritise chat input if both exist (rare), otherwise use button
         prompt = chat_val or btn_val
         
-        if prompt:
-            # A. Display User Message
-            components.render_chat_message("user", prompt)
-            st.session_state.messages.append({"role": "user", "content": prompt})
-            storage.append_chat_message(st.session_state.username, "user", prompt)
-            storage.increment_daily_message_count(st.session_state.username, today_str, 1)
-
-            # Anonymous topic classification (no raw text stored in metrics)
-            try:
-                topic = llm.classify_topic(prompt)
-                st.session_state.topic_counts[topic] = st.session_state.topic_counts.get(topic, 0) + 1
-                storage.log_ml_topic_metric(topic)
-            except Exception:
-                pass
-
-            # Anonymous aggregate topic logging (no raw text or user IDs stored)
-            try:
-                topic = helpers.classify_conversation_topic(prompt)
-                storage.log_topic_metric(topic)
-            except Exception:
-                pass
+        # Reserve today's quota atomically; if another tab used the last message,
+        # rerun so the limit notice shows instead.
+        if prompt and not storage.consume_daily_quota(st.session_state.username, today_str, daily_limit):
+            st.rerun()
 
-            # B. Get Clara's Response (with Clarity/Integrity Mirror)
-            try:
-                with st.status("Clara is reflecting...", expanded=False) as status:
-                    # 1. Emotional Analysis & Memory Retrieval
-                    memory_context = ""
-                    try:
-                        # Async-like extraction (conceptually)
-                        emotion_data = llm.extract_emotional_metadata(prompt)
-                        
-                        # a) Semantic Search (General context)
-                        related_memories = memory.search_memories(st.session_state.username, prompt, n_results=3)
-                        
-                        # b) Pattern Search (Integrity Mirror)
-                        pattern_memories = []
-                        if emotion_data["weight"] >= 7:
-                            pattern_memories = memory.search_patterns(st.session_state.username, emotion_data["tone"], n_results=3)
-                        
-                        # Combine & Deduplicate
-                        all_memories = {}
-                        for m in related_memories + pattern_memories:
-                            all_memories[m["id"]] = m
-                        
-                        if all_memories:
-                            memory_context = "\n[INTEGRITY MIRROR - RELEVANT MEMORIES]\n"
-                            for m in all_memories.values():
-                                memory_context += f"- ({m['metadata']['timestamp'][:10]}) {m['content']} [Tone: {m['metadata'].get('tone')}]\n"
-                    except Exception as e:
-                        print(f"Memory error: {e}") 
-
-                    # 2. Add Context to Prompt (Hidden from user UI)
-                    final_prompt = prompt
-                    if memory_context:
-                        # We prepend semantic context so Clara knows it immediately
-                        final_prompt = f"{memory_context}\n\nUser: {prompt}"
-
-                    response = chat_session.send_message(final_prompt)
-                    clara_text = response.text or ""
-                    
-                    status.update(label="Clara has gathered her thoughts", state="complete", expanded=False)
-                
-                # 3. Store this interaction in long-term memory
+        if prompt:
+            # Identifies this turn from state that doesn't change when it is replayed (the
+            # session, the conversation length before it and the prompt); message ids derive
+            # from it, so a retried or replayed write of this turn can't duplicate a message
+            # while the same text sent again later still gets its own.
+            prompt_digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+            turn_seq = f"{st.session_state.session_id}-{len(st.session_state.messages)}-{prompt_digest}"
+
+            # Buffer this turn's Firestore writes (messages, topic metrics) into one batch.
+            # The buffer flushes when the block exits, including on errors and st.rerun().
+            with storage.turn_writes():
+                # A. Display User Message
+                components.render_chat_message("user", prompt)
+                st.session_state.messages.append({"role": "user", "content": prompt})
+                storage.append_chat_message(st.session_state.username, "user", prompt, turn_seq=turn_seq)
+
+                # Anonymous topic classification (no raw text stored in metrics)
                 try:
-                    memory.store_memory(
-                        st.session_state.username, 
-                        prompt, 
-                        {
-                            "role": "user",
-                            "tone": emotion_data["tone"], 
-                            "weight": emotion_data["weight"],
-                            "topic": topic if 'topic' in locals() else "General"
-                        }
-                    )
+                    topic = llm.classify_topic(prompt)
+                    st.session_state.topic_counts[topic] = st.session_state.topic_counts.get(topic, 0) + 1
+                    storage.log_ml_topic_metric(topic)
                 except Exception:
                     pass
 
-
-                # If the user explicitly asks for a full / detailed answer,
-                # don't trim; otherwise, keep replies concise based on plan.
-                if not helpers.user_wants_full_answer(prompt):
-                    # Adjust answer length based on plan:
-                    # free users get more concise replies, Clara Plus users get more room.
-                    if plan == "plus":
-                        max_chars = 1400
-                    else:
-                        max_chars = 700
-                    clara_text = helpers.trim_response_for_conciseness(clara_text, max_chars=max_chars)
-
-                components.render_chat_message("assistant", clara_text)
-                st.session_state.messages.append({"role": "assistant", "content": clara_text})
-                
-                # Store Clara's response in memory too
+                # Anonymous aggregate topic logging (no raw text or user IDs stored)
                 try:
-                    memory.store_memory(
-                        st.session_state.username,
-                        clara_text,
-                        {
-                            "role": "assistant",
-                            "topic": topic if 'topic' in locals() else "General"
-                        }
-                    )
+                    topic = helpers.classify_conversation_topic(prompt)
+                    storage.log_topic_metric(topic)
                 except Exception:
                     pass
 
-                # D. SAVE TO DATABASE (Firestore Chat Message)
-                storage.append_chat_message(st.session_state.username, "assistant", clara_text)
-
-                # E. Occasionally refresh the long-term summary so Clara remembers enduring context
+                # B. Get Clara's Response (with Clarity/Integrity Mirror)
                 try:
-                    if len(st.session_state.messages) >= 20:
-                        # Refresh every ~15 messages, with a bit of randomness to
-                        # avoid unnecessary calls in very long chats.
-                        if len(st.session_state.messages) % 15 == 0 and random.random() < 0.6:
-                            # Summarise the recent conversation into a short, durable memory
-                            recent_for_summary = st.session_state.messages[-60:]
-                            convo_text = []
-                            for m in recent_for_summary:
-                                speaker = "User" if m["role"] == "user" else "Clara"
-                                convo_text.append(f"{speaker}: {m['content']}")
-                            summary_prompt = (
-                                "Below is a conversation between the user and Clara.\n\n"
-                                + "\n".join(convo_text)
-                                + "\n\nWrite a durable memory summary of the user."
+                    with st.status("Clara is reflecting...", expanded=False) as status:
+                        # 1. Emotional Analysis & Memory Retrieval
+                        memory_context = ""
+                        try:
+                            # Async-like extraction (conceptually)
+                            emotion_data = llm.extract_emotional_metadata(prompt)
+                        
+                            # Semantic search (general context) plus, for heavy moments, the
+                            # tone pattern search (Integrity Mirror): one embedding request,
+                            # both queries in parallel, deduplicated and ranked
+                            all_memories = memory.retrieve_context(
+                                st.session_state.username,
+                                prompt,
+                                tone=emotion_data["tone"],
+                                weight=emotion_data["weight"],
+                                n_results=3,
                             )
-                            # Use concise summary model
-                            summary_response = llm.get_summary_model().generate_content(summary_prompt)
-                            summary_text = getattr(summary_response, "text", "").strip()
-                            if summary_text:
-                                storage.save_chat_summary(st.session_state.username, summary_text)
-                except Exception:
-                    pass
+                        
+                            if all_memories:
+                                memory_context = "\n[INTEGRITY MIRROR - RELEVANT MEMORIES]\n"
+                                for m in all_memories:
+                                    memory_context += f"- ({m['metadata']['timestamp'][:10]}) {m['content']} [Tone: {m['metadata'].get('tone')}]\n"
+                        except Exception as e:
+                            print(f"Memory error: {e}") 
+
+                        # 2. Add Context to Prompt (Hidden from user UI)
+                        final_prompt = prompt
+                        if memory_context:
+                            # We prepend semantic context so Clara knows it immediately
+                            final_prompt = f"{memory_context}\n\nUser: {prompt}"
+
+                        response = chat_session.send_message(final_prompt)
+                        clara_text = response.text or ""
+                    
+                        status.update(label="Clara has gathered her thoughts", state="complete", expanded=False)
+                
+                    # If the user explicitly asks for a full / detailed answer,
+                    # don't trim; otherwise, keep replies concise based on plan.
+                    if not helpers.user_wants_full_answer(prompt):
+                        # Adjust answer length based on plan:
+                        # free users get more concise replies, Clara Plus users get more room.
+                        if plan == "plus":
+                            max_chars = 1400
+                        else:
+                            max_chars = 700
+                        clara_text = helpers.trim_response_for_conciseness(clara_text, max_chars=max_chars)
 
-                # F. Refresh Logic
-                # We force a rerun so that the "Continue" button disappears from its old spot
-                # and reappears at the bottom of the new chat history if needed.
-                st.rerun()
+                    components.render_chat_message("assistant", clara_text)
+                    st.session_state.messages.append({"role": "assistant", "content": clara_text})
                 
-            except Exception as e:
-                error_message = str(e)
-                if "429" in error_message or "quota" in error_message.lower():
-                    st.warning(
-                        "Clara’s thinking is hitting the limits of the current plan for a moment.\n\n"
-                        "Give it a little time and try again. If this keeps happening, it might be a temporary connection issue."
-                    )
-                else:
-                    st.error(f"Clara hit an unexpected error: {type(e).__name__}: {error_message}")
+                    # 3. Queue this interaction (prompt and Clara's response) for long-term memory;
+                    # background workers embed and upsert it so the reply isn't held up
+                    try:
+                        memory.enqueue_memories(
+                            st.session_state.username,
+                            [
+                                (
+                                    prompt,
+                                    {
+                                        "role": "user",
+                                        "tone": emotion_data["tone"],
+                                        "weight": emotion_data["weight"],
+                                        "topic": topic if 'topic' in locals() else "General"
+                                    }
+                                ),
+                                (
+                                    clara_text,
+                                    {
+                                        "role": "assistant",
+                                        "topic": topic if 'topic' in locals() else "General"
+                                    }
+                                ),
+                            ]
+                        )
+                    except Exception:
+                        pass
+
+                    # D. SAVE TO DATABASE (Firestore Chat Message)
+                    storage.append_chat_message(st.session_state.username, "assistant", clara_text, turn_seq=turn_seq)
+
+                    # E. Occasionally refresh the long-term summary so Clara remembers enduring context
+                    try:
+                        if len(st.session_state.messages) >= 20:
+                            # Refresh every ~15 messages, with a bit of randomness to
+                            # avoid unnecessary calls in very long chats.
+                            if len(st.session_state.messages) % 15 == 0 and random.random() < 0.6:
+                                # Summarise the recent conversation into a short, durable memory
+                                recent_for_summary = st.session_state.messages[-60:]
+                                convo_text = []
+                                for m in recent_for_summary:
+                                    speaker = "User" if m["role"] == "user" else "Clara"
+                                    convo_text.append(f"{speaker}: {m['content']}")
+                                summary_prompt = (
+                                    "Below is a conversation between the user and Clara.\n\n"
+                                    + "\n".join(convo_text)
+                                    + "\n\nWrite a durable memory summary of the user."
+                                )
+                                # Use concise summary model
+                                summary_response = llm.get_summary_model().generate_content(summary_prompt)
+                                summary_text = getattr(summary_response, "text", "").strip()
+                                if summary_text:
+                                    storage.save_chat_summary(st.session_state.username, summary_text)
+                    except Exception:
+                        pass
+
+                    # F. Refresh Logic
+                    # We force a rerun so that the "Continue" button disappears from its old spot
+                    # and reappears at the bottom of the new chat history if needed.
+                    st.rerun()
+                
+                except Exception as e:
+                    error_message = str(e)
+                    if "429" in error_message or "quota" in error_message.lower():
+                        st.warning(
+                            "Clara’s thinking is hitting the limits of the current plan for a moment.\n\n"
+                            "Give it a little time and try again. If this keeps happening, it might be a temporary connection issue."
+                        )
+                    else:
+                        st.error(f"Clara hit an unexpected error: {type(e).__name__}: {error_message}")
@@ -0,0 +1,58 @@
+import argparse
+import os
+import sys
+import time
+
+# Ensure we can import from the app
+sys.path.append(os.getcwd())
+
+from pinecone import ServerlessSpec
+
+from clara_app.services import memory
+
+# Creates the Clara memory index if it doesn't exist, waits until it is ready and
+# prints its host. Run once per environment (deploy step), then set the printed
+# PINECONE_INDEX_HOST secret so app processes open the index without any
+# control-plane calls. The app never creates the index itself.
+
+def main():
+    parser = argparse.ArgumentParser(description="Provision the Clara memory index in Pinecone.")
+    parser.add_argument("--cloud", default="aws")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--timeout", type=int, default=300, help="Seconds to wait for the index to become ready")
+    args = parser.parse_args()
+
+    pc = memory._get_client()
+    if pc is None:
+        print("Error: PINECONE_API_KEY is not set.")
+        sys.exit(1)
+
+    if memory.INDEX_NAME not in pc.list_indexes().names():
+        print(f"Creating index '{memory.INDEX_NAME}' ({memory.EMBEDDING_DIMENSION} dims, cosine, {args.cloud}/{args.region})...")
+        pc.create_index(
+            name=memory.INDEX_NAME,
+            dimension=memory.EMBEDDING_DIMENSION,
+            metric="cosine",
+            spec=ServerlessSpec(cloud=args.cloud, region=args.region)
+        )
+    else:
+        print(f"Index '{memory.INDEX_NAME}' already exists.")
+
+    deadline = time.monotonic() + args.timeout
+    description = pc.describe_index(memory.INDEX_NAME)
+    while not description.status["ready"]:
+        if time.monotonic() > deadline:
+            print(f"Error: index not ready after {args.timeout}s; re-run to keep waiting.")
+            sys.exit(1)
+        time.sleep(2)
+        description = pc.describe_index(memory.INDEX_NAME)
+
+    if description.dimension != memory.EMBEDDING_DIMENSION:
+        print(f"Warning: index has {description.dimension} dimensions, the app embeds {memory.EMBEDDING_DIMENSION}.")
+
+    print("\n--- INDEX READY ---")
+    print(f"PINECONE_INDEX_HOST = \"{description.host}\"")
+    print("Add this to .streamlit/secrets.toml (or the environment) so the app skips the lookup.")
+
+if __name__ == "__main__":
+    main()
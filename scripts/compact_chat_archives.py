@@ -0,0 +1,49 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Ensure we can import from the app
+sys.path.append(os.getcwd())
+
+from clara_app.constants import ARCHIVE_AFTER_DAYS, ARCHIVE_CHUNK_SIZE
+from clara_app.services import storage
+
+# Rolls old messages into chats/{id}/archives docs (see storage.compact_chat_messages).
+# Safe to run repeatedly, e.g. nightly: each archive is committed together with the
+# deletion of its messages, and only full chunks are written.
+
+def compact(chat_id, days, chunk_size):
+    try:
+        return storage.compact_chat_messages(chat_id, older_than_days=days, chunk_size=chunk_size)
+    except Exception as e:
+        print(f"  ! {chat_id}: {e}")
+        return 0
+
+def chunk_size(value):
+    size = int(value)
+    if not 1 <= size <= storage.MAX_ARCHIVE_CHUNK_SIZE:
+        raise argparse.ArgumentTypeError(f"must be between 1 and {storage.MAX_ARCHIVE_CHUNK_SIZE}")
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact old Clara chat messages into archive docs.")
+    parser.add_argument("chat_ids", nargs="*", help="Chats to compact (default: all)")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="Archive messages older than this")
+    parser.add_argument("--chunk-size", type=chunk_size, default=ARCHIVE_CHUNK_SIZE, help="Messages per archive doc")
+    parser.add_argument("--workers", type=int, default=8, help="Chats compacted in parallel")
+    args = parser.parse_args()
+
+    chat_ids = args.chat_ids or storage.get_backend().iter_chat_ids()
+    chats = archived = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        for chat_id, n in pool.map(lambda c: (c, compact(c, args.days, args.chunk_size)), chat_ids):
+            chats += 1
+            archived += n
+            if n:
+                print(f"{chat_id}: archived {n} messages")
+
+    print(f"\n--- COMPACTION COMPLETE ---\nchats scanned: {chats}\nmessages archived: {archived}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Ensure we can import from the app
+sys.path.append(os.getcwd())
+
+from clara_app.constants import MEMORY_CONSOLIDATE_AFTER_DAYS, MEMORY_CONSOLIDATE_SIMILARITY
+from clara_app.services import memory, storage
+
+# Folds old memories into summary vectors (see memory.consolidate_memories), keeping
+# each user's vector count bounded. Safe to run repeatedly, e.g. weekly: summaries
+# are upserted under deterministic ids before their originals are deleted.
+
+def main():
+    parser = argparse.ArgumentParser(description="Consolidate old Clara memories into summary vectors.")
+    parser.add_argument("usernames", nargs="*", help="Chat ids to consolidate (default: every chat)")
+    parser.add_argument("--days", type=int, default=MEMORY_CONSOLIDATE_AFTER_DAYS, help="Consolidate memories older than this")
+    parser.add_argument("--similarity", type=float, default=MEMORY_CONSOLIDATE_SIMILARITY, help="Cosine similarity to join a cluster")
+    parser.add_argument("--min-cluster", type=int, default=3, help="Smallest cluster worth summarising")
+    parser.add_argument("--workers", type=int, default=4, help="Users consolidated in parallel")
+    parser.add_argument("--dry-run", action="store_true", help="Report clusters without summarising or deleting")
+    args = parser.parse_args()
+
+    if memory.get_vector_backend() is None:
+        print("Error: vector store unavailable (check PINECONE_API_KEY / CLARA_VECTOR_BACKEND).")
+        return
+
+    usernames = args.usernames or storage.get_backend().iter_chat_ids()
+
+    def run(username):
+        try:
+            return username, memory.consolidate_memories(
+                username,
+                older_than_days=args.days,
+                similarity=args.similarity,
+                min_cluster_size=args.min_cluster,
+                dry_run=args.dry_run,
+            )
+        except Exception as e:
+            print(f"  ! {username}: {e}")
+            return username, {}
+
+    totals = {"scanned": 0, "clusters": 0, "consolidated": 0, "created": 0}
+    users = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        for username, stats in pool.map(run, usernames):
+            users += 1
+            for key in totals:
+                totals[key] += stats.get(key, 0)
+            if stats.get("clusters"):
+                print(f"{username}: {stats['consolidated']} memories in {stats['clusters']} clusters")
+
+    print("\n--- CONSOLIDATION COMPLETE ---" + (" (dry run)" if args.dry_run else ""))
+    print(f"users scanned: {users}\nmemories scanned: {totals['scanned']}")
+    print(f"memories {'to fold' if args.dry_run else 'folded'}: {totals['consolidated']}\nsummaries written: {totals['created']}")
+
+if __name__ == "__main__":
+    main()
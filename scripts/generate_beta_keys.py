@@ -1,19 +1,81 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
-import random
+import argparse
+import secrets
 import string
-import sys
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core.exceptions import AlreadyExists
 
 # To run this, you need your firebase credentials path or service account dict.
 # It will try to use the ones from the app's environment.
+#
+# Usage: python scripts/generate_beta_keys.py [count] [--workers N] [--output keys.txt]
+# Keys are checked against existing beta_keys docs (get_all, no field data) and
+# written with create(), so a key that appears concurrently is never overwritten.
+
+# Firestore rejects batches with more than 500 writes.
+MAX_BATCH_WRITES = 500
+# Give up after this many rounds in a row that write no new keys.
+MAX_EMPTY_ROUNDS = 3
 
 def generate_key(length=8):
     """Generate a random alphanumeric key."""
     chars = string.ascii_uppercase + string.digits
-    return ''.join(random.choice(chars) for _ in range(length))
+    return ''.join(secrets.choice(chars) for _ in range(length))
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def fresh_candidates(n, exclude):
+    """n distinct new keys, none of them in `exclude`."""
+    candidates = set()
+    while len(candidates) < n:
+        key = generate_key()
+        if key not in exclude:
+            candidates.add(key)
+    return list(candidates)
+
+def without_existing(db, keys):
+    """Drop keys that already have a beta_keys doc (one get_all round trip per chunk)."""
+    refs = [db.collection("beta_keys").document(k) for k in keys]
+    taken = {snap.id for snap in db.get_all(refs, field_paths=[]) if snap.exists}
+    return [k for k in keys if k not in taken]
+
+def write_keys(db, keys):
+    """
+    Create one batch of keys. Returns the keys actually written. Only key
+    collisions (AlreadyExists) are handled; any other commit error propagates.
+    """
+    data = {"used": False, "createdAt": firestore.SERVER_TIMESTAMP, "generatedBy": "script"}
+    batch = db.batch()
+    for k in keys:
+        batch.create(db.collection("beta_keys").document(k), data)
+    try:
+        batch.commit()
+        return keys
+    except AlreadyExists as e:
+        # A key was claimed between the check and the write; create the rest one by one.
+        print(f"Batch failed ({e}); retrying {len(keys)} keys individually")
+        written = []
+        for k in keys:
+            try:
+                db.collection("beta_keys").document(k).create(data)
+                written.append(k)
+            except AlreadyExists:
+                pass
+        return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate unused beta access keys.")
+    parser.add_argument("count", nargs="?", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=8, help="Batches checked/written in parallel")
+    parser.add_argument("--output", help="Write the keys to this file instead of printing them")
+    args = parser.parse_args()
+    count = max(0, args.count)
 
-def main(count=10):
     # Try to find credentials
     cred_path = "clara-companion-fe6a8-firebase-adminsdk-fbsvc-fca8258bfb.json"
     if not os.path.exists(cred_path):
@@ -26,36 +88,39 @@ def main(count=10):
         firebase_admin.initialize_app(cred)
 
     db = firestore.client()
-    
-    generated_keys = []
-    
+
     print(f"Generating {count} unique access keys...")
-    
-    batch = db.batch()
-    for _ in range(count):
-        new_key = generate_key()
-        # Ensure uniqueness (simple check, for large scale would need more)
-        ref = db.collection("beta_keys").document(new_key)
-        batch.set(ref, {
-            "used": False,
-            "createdAt": firestore.SERVER_TIMESTAMP,
-            "generatedBy": "script"
-        })
-        generated_keys.append(new_key)
-    
-    batch.commit()
-    
-    print("\n--- GENERATED KEYS ---")
-    for k in generated_keys:
-        print(k)
-    print("----------------------\n")
-    print(f"Successfully uploaded {count} keys to Firestore.")
+
+    generated_keys = []
+    empty_rounds = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        # Each round tops up whatever collided in the previous one.
+        while len(generated_keys) < count:
+            candidates = fresh_candidates(count - len(generated_keys), exclude=set(generated_keys))
+            before = len(generated_keys)
+            try:
+                free = [k for keys in pool.map(lambda c: without_existing(db, c), chunked(candidates, MAX_BATCH_WRITES)) for k in keys]
+                for keys in pool.map(lambda c: write_keys(db, c), chunked(free, MAX_BATCH_WRITES)):
+                    generated_keys.extend(keys)
+            except Exception as e:
+                print(f"Error: writing keys failed after {len(generated_keys)}/{count}: {e}")
+                sys.exit(1)
+            print(f"  {len(generated_keys)}/{count} written")
+            empty_rounds = empty_rounds + 1 if len(generated_keys) == before else 0
+            if empty_rounds >= MAX_EMPTY_ROUNDS:
+                print(f"Error: {MAX_EMPTY_ROUNDS} rounds in a row wrote no new keys; giving up at {len(generated_keys)}/{count}.")
+                sys.exit(1)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write("\n".join(generated_keys) + "\n")
+        print(f"\nWrote keys to {args.output}")
+    else:
+        print("\n--- GENERATED KEYS ---")
+        for k in generated_keys:
+            print(k)
+        print("----------------------\n")
+    print(f"Successfully uploaded {len(generated_keys)} keys to Firestore.")
 
 if __name__ == "__main__":
-    num_keys = 10
-    if len(sys.argv) > 1:
-        try:
-            num_keys = int(sys.argv[1])
-        except ValueError:
-            pass
-    main(num_keys)
+    main()
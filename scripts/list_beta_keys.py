@@ -1,8 +1,49 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
+import argparse
+import csv
+import datetime
+import json
 import os
+import sys
+
+# Usage: python scripts/list_beta_keys.py [--all] [--count-only] [--format text|csv|ndjson] [--output FILE]
+# The total comes from a server-side count() aggregation; keys are streamed a
+# page at a time with only the listed fields projected, so memory stays flat.
+
+FIELDS = ["createdAt", "used", "usedBy", "usedAt"]
+
+def _plain(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+def ordered(query):
+    # Ordering by createdAt also filters out docs without it; count and list the same query.
+    return query.order_by("createdAt", direction=firestore.Query.DESCENDING)
+
+def iter_keys(query, fields, page_size):
+    """Yield {"code", *fields} rows page by page, newest first."""
+    query = ordered(query.select(fields)).limit(page_size)
+    cursor = None
+    while True:
+        page = (query.start_after(cursor) if cursor is not None else query).get()
+        for doc in page:
+            data = doc.to_dict() or {}
+            yield {"code": doc.id, **{f: _plain(data.get(f)) for f in fields}}
+        if len(page) < page_size:
+            return
+        cursor = page[-1]
 
 def main():
+    parser = argparse.ArgumentParser(description="List beta access keys.")
+    parser.add_argument("--all", action="store_true", help="Include keys that have been used")
+    parser.add_argument("--count-only", action="store_true", help="Only print the number of keys")
+    parser.add_argument("--format", choices=["text", "csv", "ndjson"], default="text")
+    parser.add_argument("--output", help="Write to this file instead of stdout")
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
     # Try to find credentials
     cred_path = "clara-companion-fe6a8-firebase-adminsdk-fbsvc-fca8258bfb.json"
     if not os.path.exists(cred_path):
@@ -14,23 +55,45 @@ def main():
         firebase_admin.initialize_app(cred)
 
     db = firestore.client()
-    
-    # Query for unused keys
-    keys_ref = db.collection("beta_keys")
-    query = keys_ref.where("used", "==", False).order_by("createdAt", direction=firestore.Query.DESCENDING)
-    docs = query.stream()
-    
-    unused_keys = []
-    for doc in docs:
-        unused_keys.append(doc.id)
-    
-    if not unused_keys:
+
+    # Query for unused keys (or every key with --all)
+    query = db.collection("beta_keys")
+    if not args.all:
+        query = query.where("used", "==", False)
+    fields = FIELDS if args.all else ["createdAt"]
+    label = "KEYS" if args.all else "UNUSED KEYS"
+
+    total = ordered(query).count().get()[0][0].value
+    undated = query.count().get()[0][0].value - total
+    if undated:
+        print(f"Warning: {undated} keys have no createdAt and are not included below.", file=sys.stderr)
+    if args.count_only:
+        print(total)
+        return
+    if not total:
         print("\nNo unused beta keys found. Run 'python scripts/generate_beta_keys.py' to create some!")
-    else:
-        print(f"\n--- FOUND {len(unused_keys)} UNUSED KEYS ---")
-        for k in unused_keys:
-            print(k)
-        print("-------------------------------\n")
+        return
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        rows = iter_keys(query, fields, max(1, args.page_size))
+        if args.format == "csv":
+            writer = csv.DictWriter(out, fieldnames=["code"] + fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        elif args.format == "ndjson":
+            for row in rows:
+                out.write(json.dumps(row) + "\n")
+        else:
+            out.write(f"\n--- FOUND {total} {label} ---\n")
+            for row in rows:
+                out.write(row["code"] + "\n")
+            out.write("-------------------------------\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.output:
+        print(f"Wrote {total} keys to {args.output}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,41 @@
+import argparse
+import os
+import sys
+
+# Ensure we can import from the app
+sys.path.append(os.getcwd())
+
+from clara_app.services import storage
+from clara_app.services.storage_backend import approx_doc_bytes
+
+# Compare what a full chat-doc read returns with the projected reads the app now makes.
+# Usage: python scripts/measure_chat_reads.py <chat_id> [<chat_id> ...]
+
+def measure(backend, chat_id):
+    full = backend.get_chat(chat_id)
+    if full is None:
+        print(f"{chat_id}: no such chat doc")
+        return
+    profile = backend.get_chat(chat_id, fields=storage.CHAT_PROFILE_FIELDS)
+    legacy = full.get("messages") or []
+    full_bytes = approx_doc_bytes(full)
+    profile_bytes = approx_doc_bytes(profile)
+    saved = 100 * (1 - profile_bytes / full_bytes) if full_bytes else 0
+    print(f"{chat_id}:")
+    print(f"  full doc:        {full_bytes:>10,} bytes ({len(legacy)} legacy messages)")
+    print(f"  profile fields:  {profile_bytes:>10,} bytes ({saved:.1f}% smaller)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure bytes returned by full vs projected chat-doc reads.")
+    parser.add_argument("chat_ids", nargs="+")
+    args = parser.parse_args()
+
+    backend = storage.get_backend()
+    for chat_id in args.chat_ids:
+        try:
+            measure(backend, chat_id)
+        except Exception as e:
+            print(f"{chat_id}: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Ensure we can import from the app
+sys.path.append(os.getcwd())
+
+from clara_app.services import storage
+from clara_app.utils.helpers import email_to_user_id, normalize_email
+
+# Offline replacement for the request-path migrations in storage.py:
+# - legacy `messages` arrays on chats/{id} -> chats/{id}/messages/*
+# - email-keyed chats/{email} docs -> chats/{email_to_user_id(email)}
+# Copied messages get deterministic ids and each doc is flagged "started" before
+# copying and "done" after, so an interrupted doc is redone by overwriting rather
+# than duplicated. Re-running (or resuming) is always safe.
+# Once it has completed, set CLARA_LEGACY_MIGRATION_ON_READ=0 for the app.
+
+MAX_BATCH_WRITES = 500
+DEFAULT_CHECKPOINT = "migrate_legacy_chats.checkpoint.json"
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {"last_doc_id": None, "stats": {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(path, checkpoint):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)
+
+def _valid_message(m):
+    return isinstance(m, dict) and m.get("role") in ("user", "assistant") and isinstance(m.get("content"), str)
+
+def write_messages(db, messages_ref, messages, dry_run):
+    """Write (doc_id, message) pairs in batches of MAX_BATCH_WRITES. Returns the number written."""
+    if dry_run:
+        return len(messages)
+    for start in range(0, len(messages), MAX_BATCH_WRITES):
+        batch = db.batch()
+        for doc_id, m in messages[start:start + MAX_BATCH_WRITES]:
+            batch.set(messages_ref.document(doc_id), m)
+        batch.commit()
+    return len(messages)
+
+def set_migration_state(ref, state, dry_run, **extra):
+    if not dry_run:
+        ref.set({"chatMeta": {"bulkMigration": state, **extra}}, merge=True)
+
+def legacy_array_as_messages(legacy_messages):
+    """Give legacy array entries increasing timestamps so ordering is preserved."""
+    valid = [m for m in legacy_messages if _valid_message(m)]
+    base = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=len(valid) + 1)
+    return [
+        (f"legacy-{i:06d}", {"role": m["role"], "content": m["content"], "ts": base + datetime.timedelta(seconds=i + 1)})
+        for i, m in enumerate(valid)
+    ]
+
+def has_message_docs(chat_ref):
+    return bool(chat_ref.collection("messages").limit(1).get())
+
+def migrate_messages_array(db, snap, dry_run):
+    """Move a legacy `messages` array into the subcollection. Returns an outcome label."""
+    data = snap.to_dict() or {}
+    legacy = data.get("messages") or []
+    if not isinstance(legacy, list) or not legacy:
+        return "no_legacy_array"
+    resuming = (data.get("chatMeta") or {}).get("bulkMigration") == "started"
+    if not resuming and has_message_docs(snap.reference):
+        # The app already reads the subcollection; leave the array alone rather than risk merging twice.
+        return "array_skipped_subcollection_exists"
+    set_migration_state(snap.reference, "started", dry_run)
+    write_messages(db, snap.reference.collection("messages"), legacy_array_as_messages(legacy), dry_run)
+    if not dry_run:
+        snap.reference.set({"messages": [], "chatMeta": {"legacyMigrated": True, "bulkMigration": "done"}}, merge=True)
+    return "array_migrated"
+
+def migrate_email_doc(db, snap, dry_run):
+    """Copy an email-keyed chat doc (and all its messages) to its stable hashed id."""
+    legacy_id = snap.id
+    email = normalize_email(legacy_id)
+    new_id = email_to_user_id(email)
+    if not new_id or new_id == legacy_id:
+        return "email_doc_skipped"
+    new_ref = db.collection("chats").document(new_id)
+    new_snap = new_ref.get()
+    if new_snap.exists and ((new_snap.to_dict() or {}).get("chatMeta") or {}).get("bulkMigration") != "started":
+        return "email_doc_already_migrated"
+
+    data = snap.to_dict() or {}
+    if not dry_run:
+        new_ref.set(
+            {
+                "profile": data.get("profile", {}) or {},
+                "summary": data.get("summary", "") or "",
+                "clearedAt": data.get("clearedAt"),
+                "usage": data.get("usage", {}) or {},
+                "chatMeta": {
+                    "migratedFrom": legacy_id,
+                    "migratedAt": datetime.datetime.now(datetime.timezone.utc),
+                    "email": email,
+                    "bulkMigration": "started",
+                },
+            },
+            merge=True,
+        )
+
+    # Prefer the messages subcollection; fall back to the legacy array.
+    messages = []
+    for doc in snap.reference.collection("messages").order_by("ts").stream():
+        d = doc.to_dict() or {}
+        if _valid_message(d):
+            # Keep the source id so a resumed copy overwrites instead of duplicating.
+            messages.append((doc.id, {"role": d["role"], "content": d["content"], "ts": d.get("ts") or datetime.datetime.now(datetime.timezone.utc)}))
+    if not messages:
+        messages = legacy_array_as_messages(data.get("messages") or [])
+    write_messages(db, new_ref.collection("messages"), messages, dry_run)
+
+    set_migration_state(new_ref, "done", dry_run)
+    set_migration_state(snap.reference, "done", dry_run, migratedTo=new_id)
+    return "email_doc_migrated"
+
+def migrate_chat(db, snap, dry_run):
+    try:
+        if "@" in snap.id:
+            return migrate_email_doc(db, snap, dry_run)
+        return migrate_messages_array(db, snap, dry_run)
+    except Exception as e:
+        print(f"  ! {snap.id}: {e}")
+        return "error"
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate legacy Clara chat documents in bulk.")
+    parser.add_argument("--workers", type=int, default=8, help="Chat docs migrated in parallel")
+    parser.add_argument("--page-size", type=int, default=200, help="Chat docs fetched per page")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Progress file used to resume")
+    parser.add_argument("--restart", action="store_true", help="Ignore any existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    db = storage.get_db()
+    if db is None:
+        print("Error: could not connect to Firestore (check Firebase credentials).")
+        return
+
+    # Dry runs never advance the real checkpoint.
+    checkpoint_path = args.checkpoint + (".dry-run" if args.dry_run else "")
+    checkpoint = {"last_doc_id": None, "stats": {}} if args.restart else load_checkpoint(checkpoint_path)
+    stats = checkpoint["stats"]
+
+    query = db.collection("chats").order_by("__name__").limit(args.page_size)
+    cursor = None
+    if checkpoint["last_doc_id"]:
+        resume_snap = db.collection("chats").document(checkpoint["last_doc_id"]).get()
+        if resume_snap.exists:
+            cursor = resume_snap
+            print(f"Resuming after {checkpoint['last_doc_id']}")
+        else:
+            print("Checkpoint doc no longer exists; rescanning from the start (safe, just slower).")
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        while True:
+            page = (query.start_after(cursor) if cursor is not None else query).get()
+            if not page:
+                break
+            for outcome in pool.map(lambda s: migrate_chat(db, s, args.dry_run), page):
+                stats[outcome] = stats.get(outcome, 0) + 1
+            cursor = page[-1]
+            checkpoint["last_doc_id"] = cursor.id
+            save_checkpoint(checkpoint_path, checkpoint)
+            print(f"Processed through {cursor.id}: {stats}")
+            if len(page) < args.page_size:
+                break
+
+    print("\n--- MIGRATION COMPLETE ---" + (" (dry run)" if args.dry_run else ""))
+    for outcome, n in sorted(stats.items()):
+        print(f"{outcome}: {n}")
+
+if __name__ == "__main__":
+    main()
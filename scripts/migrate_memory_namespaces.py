@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Ensure we can import from the app
+sys.path.append(os.getcwd())
+
+from clara_app.services import memory, storage
+
+# Moves memories out of the shared default namespace into per-user namespaces.
+# For each user the shared namespace is queried with the username filter, the
+# matches are upserted into the user's namespace and only then deleted from the
+# shared one, so a re-run (or an interrupted run) just overwrites copies.
+# Once it has completed, set CLARA_MEMORY_LEGACY_FALLBACK=0 for the app.
+
+QUERY_BATCH = 1000 # Pinecone's top_k cap when values are included
+UPSERT_BATCH = 100
+# Serverless deletes are eventually consistent; give up on ids that keep reappearing after this many passes.
+MAX_STALE_PASSES = 5
+
+def migrate_user(backend, username, dry_run):
+    probe = [1.0] + [0.0] * (memory.EMBEDDING_DIMENSION - 1)
+    moved = set()
+    stale_passes = 0
+    while True:
+        matches = backend.query(
+            probe,
+            top_k=QUERY_BATCH,
+            namespace=memory.LEGACY_NAMESPACE,
+            filter={"username": {"$eq": username}},
+            include_values=True
+        )
+        fresh = [m for m in matches if m.id not in moved]
+        if dry_run or not matches:
+            return len(matches) if dry_run else len(moved)
+        if not fresh:
+            stale_passes += 1
+            if stale_passes >= MAX_STALE_PASSES:
+                return len(moved)
+            time.sleep(1)
+            continue
+
+        vectors = [{"id": m.id, "values": m.values, "metadata": m.metadata} for m in fresh]
+        for start in range(0, len(vectors), UPSERT_BATCH):
+            backend.upsert(vectors[start:start + UPSERT_BATCH], namespace=memory._namespace(username))
+        backend.delete([m.id for m in fresh], namespace=memory.LEGACY_NAMESPACE)
+        moved.update(m.id for m in fresh)
+
+def main():
+    parser = argparse.ArgumentParser(description="Move Clara memories into per-user vector namespaces.")
+    parser.add_argument("usernames", nargs="*", help="Chat ids to migrate (default: every chat)")
+    parser.add_argument("--workers", type=int, default=4, help="Users migrated in parallel")
+    parser.add_argument("--dry-run", action="store_true", help="Report how many vectors would move (first 1,000 per user)")
+    args = parser.parse_args()
+
+    backend = memory.get_vector_backend()
+    if backend is None:
+        print("Error: could not connect to Pinecone (check PINECONE_API_KEY).")
+        return
+
+    usernames = args.usernames or storage.get_backend().iter_chat_ids()
+
+    def run(username):
+        try:
+            return username, migrate_user(backend, username, args.dry_run)
+        except Exception as e:
+            print(f"  ! {username}: {e}")
+            return username, 0
+
+    users = moved = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        for username, n in pool.map(run, usernames):
+            users += 1
+            moved += n
+            if n:
+                print(f"{username}: {'would move' if args.dry_run else 'moved'} {n} vectors")
+
+    print("\n--- MIGRATION COMPLETE ---" + (" (dry run)" if args.dry_run else ""))
+    print(f"users scanned: {users}\nvectors {'to move' if args.dry_run else 'moved'}: {moved}")
+
+if __name__ == "__main__":
+    main()
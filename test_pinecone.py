@@ -12,8 +12,8 @@ def test_pinecone():
     print("--- Testing Pinecone Memory Service ---")
     
     # 0. Check API Key
-    from clara_app.constants import PINECONE_API_KEY
-    if not PINECONE_API_KEY:
+    from clara_app.constants import PINECONE_API_KEY, VECTOR_BACKEND
+    if VECTOR_BACKEND == "pinecone" and not PINECONE_API_KEY:
         print("FAILURE: PINECONE_API_KEY not found in secrets/env.")
         return
 
@@ -30,8 +30,9 @@ def test_pinecone():
     memory.store_memory(username, text, meta)
     
     # Wait for consistency (Pinecone is eventually consistent)
-    print("   Waiting 10s for index consistency...")
-    time.sleep(10)
+    if VECTOR_BACKEND == "pinecone":
+        print("   Waiting 10s for index consistency...")
+        time.sleep(10)
     
     # 3. Test Search
     print("3. Searching memory...")